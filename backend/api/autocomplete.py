@@ -0,0 +1,177 @@
+"""Автодополнение названий ингредиентов по индексу в памяти воркера."""
+import re
+from bisect import bisect_left
+from collections import Counter
+
+from api.constants import (AUTOCOMPLETE_MIN_FUZZY_LENGTH,
+                           AUTOCOMPLETE_SIMILARITY, AUTOCOMPLETE_TYPOS)
+
+WORDS = re.compile(r'\w+')
+SPACES = re.compile(r'\s+')
+
+# Ранги совпадений: чем меньше, тем выше в выдаче.
+EXACT, PREFIX, WORD_PREFIX, INFIX, TYPO, SIMILAR = range(6)
+
+
+def normalize(text):
+    """Приведение строки к виду для сравнения."""
+    return SPACES.sub(' ', text.lower().replace('ё', 'е')).strip()
+
+
+def trigrams(text):
+    """Триграммы слов строки в стиле pg_trgm."""
+    result = set()
+    for word in WORDS.findall(text):
+        padded = f'  {word} '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def allowed_typos(word):
+    """Допустимое число опечаток в слове запроса."""
+    if len(word) < AUTOCOMPLETE_MIN_FUZZY_LENGTH:
+        return 0
+    return 1 if len(word) < 5 else AUTOCOMPLETE_TYPOS
+
+
+def deletions(word, distance):
+    """Варианты слова с удалением не более distance букв."""
+    result = level = {word}
+    for _ in range(distance):
+        level = {variant[:index] + variant[index + 1:]
+                 for variant in level if len(variant) > 1
+                 for index in range(len(variant))}
+        result = result | level
+    return result
+
+
+def typo_distance(first, second, limit):
+    """
+    Расстояние Дамерау-Левенштейна (с перестановкой соседних букв);
+    при превышении limit возвращается limit + 1.
+    """
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(second) + 1))
+    for i, letter in enumerate(first, 1):
+        current = [i] + [0] * len(second)
+        for j, other in enumerate(second, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1,
+                             previous[j - 1] + (letter != other))
+            if (previous2 is not None and i > 1 and j > 1
+                    and letter == second[j - 2] and first[i - 2] == other):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+class IngredientIndex:
+    """
+    Индекс для поиска ингредиентов по мере набора.
+
+    Префиксы названия и отдельных слов ищутся бинарным поиском
+    по отсортированным массивам, вхождения и похожие названия -
+    по триграммам, опечатки в словах - по словарю вариантов
+    с удаленными буквами.
+    """
+
+    def __init__(self, items):
+        self.items = items
+        self.names = [normalize(item['name']) for item in items]
+        self.prefixes = sorted(
+            (name, position) for position, name in enumerate(self.names))
+        self.words = sorted(
+            (name[match.start():], position)
+            for position, name in enumerate(self.names)
+            for match in WORDS.finditer(name) if match.start())
+        self.trigrams = {}
+        self.trigram_counts = []
+        self.word_positions = {}
+        for position, name in enumerate(self.names):
+            grams = trigrams(name)
+            self.trigram_counts.append(len(grams))
+            for gram in grams:
+                self.trigrams.setdefault(gram, []).append(position)
+            for word in set(WORDS.findall(name)):
+                self.word_positions.setdefault(word, []).append(position)
+        self.deletions = {}
+        for word in self.word_positions:
+            for variant in deletions(word, AUTOCOMPLETE_TYPOS):
+                self.deletions.setdefault(variant, []).append(word)
+
+    @staticmethod
+    def _starting_with(keys, query):
+        """Позиции ключей отсортированного массива, начинающихся с query."""
+        index = bisect_left(keys, (query,))
+        while index < len(keys) and keys[index][0].startswith(query):
+            yield keys[index][1]
+            index += 1
+
+    def _typos(self, query):
+        """Позиции названий, где каждое слово запроса есть с опечатками."""
+        distances = None
+        for word in WORDS.findall(query):
+            limit = allowed_typos(word)
+            if not limit:
+                return {}
+            if word in self.word_positions:
+                candidates = (word,)
+            else:
+                candidates = {
+                    candidate for variant in deletions(word, limit)
+                    for candidate in self.deletions.get(variant, ())}
+            found = {}
+            for candidate in candidates:
+                distance = typo_distance(word, candidate, limit)
+                if distance > limit:
+                    continue
+                for position in self.word_positions[candidate]:
+                    found[position] = min(found.get(position, limit),
+                                          distance)
+            if distances is None:
+                distances = found
+            else:
+                distances = {position: distances[position] + distance
+                             for position, distance in found.items()
+                             if position in distances}
+        return distances or {}
+
+    def search(self, query, limit):
+        """Не более limit ингредиентов, лучшие совпадения первыми."""
+        query = normalize(query)
+        if not query:
+            return []
+        ranks = {}
+        for position in self._starting_with(self.prefixes, query):
+            ranks[position] = (
+                (EXACT,) if self.names[position] == query else (PREFIX,))
+        for position in self._starting_with(self.words, query):
+            ranks.setdefault(position, (WORD_PREFIX,))
+        if (len(ranks) < limit
+                and len(query) >= AUTOCOMPLETE_MIN_FUZZY_LENGTH):
+            grams = trigrams(query)
+            shared = Counter()
+            for gram in grams:
+                shared.update(self.trigrams.get(gram, ()))
+            # Сходство не больше доли общих триграмм запроса.
+            least = AUTOCOMPLETE_SIMILARITY * len(grams)
+            for position, count in shared.items():
+                if count < least or position in ranks:
+                    continue
+                if query in self.names[position]:
+                    ranks[position] = (INFIX,)
+                    continue
+                similarity = count / (
+                    len(grams) + self.trigram_counts[position] - count)
+                if similarity >= AUTOCOMPLETE_SIMILARITY:
+                    ranks[position] = (SIMILAR, -similarity)
+            if sum(rank < (TYPO,) for rank in ranks.values()) < limit:
+                for position, distance in self._typos(query).items():
+                    if ranks.get(position, (TYPO,)) >= (TYPO,):
+                        ranks[position] = (TYPO, distance)
+        best = sorted(ranks, key=lambda position: (
+            ranks[position], len(self.names[position]), self.names[position]))
+        return [self.items[position] for position in best[:limit]]
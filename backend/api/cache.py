@@ -0,0 +1,154 @@
+"""
+Кэш ответов ленты и страниц рецептов для анонимных пользователей
+и файлов списка покупок.
+"""
+import time
+from functools import wraps
+from hashlib import md5
+
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from api.constants import RECIPE_CACHE_TIMEOUT, SHOPPING_LIST_CACHE_TIMEOUT
+from recipes.models import Cart
+
+# Версия всех ответов (меняется при правке тэгов и ингредиентов).
+GLOBAL_VERSION_KEY = 'recipes:version:global'
+# Версия ленты рецептов.
+LIST_VERSION_KEY = 'recipes:version:list'
+# Версия страницы рецепта.
+DETAIL_VERSION_KEY = 'recipes:version:detail:{pk}'
+# Ключ закэшированного ответа.
+RESPONSE_KEY = 'recipes:response:{scope}:{digest}'
+# Ключ файла списка покупок.
+SHOPPING_LIST_KEY = 'shopping_list:{digest}'
+# Счетчики статистики кэша.
+STATS_KEY = 'recipes:stats:{name}'
+STATS = ('hits', 'misses', 'invalidations')
+
+
+def get_versions(*keys):
+    """
+    Текущие версии ключей.
+
+    Отсутствующая версия заводится от текущего времени, чтобы
+    не совпасть ни с одной версией вытесненных из кэша записей.
+    """
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*keys):
+    """Смена версий: все ответы со старыми версиями перестают читаться."""
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+    record_stat('invalidations')
+
+
+def invalidate_recipes(*recipe_ids):
+    """Сброс ленты и страниц перечисленных рецептов."""
+    bump_versions(LIST_VERSION_KEY, *(
+        DETAIL_VERSION_KEY.format(pk=pk) for pk in recipe_ids))
+
+
+def invalidate_all():
+    """Сброс всех закэшированных ответов."""
+    bump_versions(GLOBAL_VERSION_KEY)
+
+
+def record_stat(name):
+    """Увеличение счетчика статистики."""
+    key = STATS_KEY.format(name=name)
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def get_stats():
+    """Счетчики попаданий, промахов и сбросов кэша."""
+    values = cache.get_many([STATS_KEY.format(name=name) for name in STATS])
+    return {name: values.get(STATS_KEY.format(name=name), 0)
+            for name in STATS}
+
+
+def reset_stats():
+    """Обнуление счетчиков статистики."""
+    cache.delete_many([STATS_KEY.format(name=name) for name in STATS])
+
+
+def response_key(request, pk=None):
+    """
+    Ключ ответа по хосту, нормализованным параметрам запроса
+    и текущим версиям ленты или рецепта.
+    """
+    if pk is None:
+        scope = 'list'
+        versions = get_versions(GLOBAL_VERSION_KEY, LIST_VERSION_KEY)
+    else:
+        scope = f'detail:{pk}'
+        versions = get_versions(GLOBAL_VERSION_KEY,
+                                DETAIL_VERSION_KEY.format(pk=pk))
+    params = sorted((key, sorted(values))
+                    for key, values in request.query_params.lists())
+    digest = md5(repr((request.get_host(), params, versions)).encode())
+    return RESPONSE_KEY.format(scope=scope, digest=digest.hexdigest())
+
+
+def cache_anonymous(view_method):
+    """Кэширование ответа list/retrieve вьюсета для анонимов."""
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return view_method(self, request, *args, **kwargs)
+        key = response_key(
+            request, kwargs.get(self.lookup_url_kwarg or self.lookup_field))
+        data = cache.get(key)
+        if data is not None:
+            record_stat('hits')
+            return Response(data)
+        record_stat('misses')
+        response = view_method(self, request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, RECIPE_CACHE_TIMEOUT)
+        return response
+    return wrapper
+
+
+def shopping_list_key(user, file_format, today):
+    """
+    Ключ файла списка покупок по содержимому корзины: рецептам
+    и версиям их страниц, которые меняются при правке состава.
+    """
+    recipe_ids = list(Cart.objects.filter(user=user).order_by(
+        'recipe_id').values_list('recipe_id', flat=True))
+    versions = get_versions(GLOBAL_VERSION_KEY, *(
+        DETAIL_VERSION_KEY.format(pk=pk) for pk in recipe_ids))
+    digest = md5(
+        repr((file_format, str(today), recipe_ids, versions)).encode())
+    return SHOPPING_LIST_KEY.format(digest=digest.hexdigest())
+
+
+def cache_stream(key, chunks):
+    """
+    Части файла из кэша или из генератора с сохранением
+    в кэш после отдачи последней части.
+    """
+    body = cache.get(key)
+    if body is not None:
+        yield body
+        return
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    cache.set(key, b''.join(parts), SHOPPING_LIST_CACHE_TIMEOUT)
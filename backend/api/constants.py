@@ -14,7 +14,9 @@ MAX_ADMIN_NAME_LENGTH = 25
 MAIL_LENGTH = 254
 # Количество выводимых рецептов, если не передан параметр.
 RECIPES_LIMIT = 6
-# Длина короткой ссылки.
+# Параметр ограничения рецептов автора в подписках.
+RECIPES_LIMIT_PARAM = 'recipes_limit'
+# Минимальная длина кода короткой ссылки.
 S_LINK_LENGTH = 3
 # Минимально время приготовления рецепта.
 COOKING_TIME = 1
@@ -26,11 +28,49 @@ ADMIN_EXTRA_FIELDS = 0
 ADMIN_FIELDS = 1
 # Константа для страницы /me.
 ACTION_ME = 'me'
+# Изменение профиля по id - только самому пользователю.
+USER_UPDATE_ACTIONS = ('update', 'partial_update')
 # Регулярное выражение для валидации.
 REGEX_VALIDATION = r'^[\w.@+-]+\Z'
 # Исходное значение пагинации
 PAGE_SIZE = 6
 # Параметр для типа пагинации.
 PAGE_QUERY_PARAM = 'limit'
+# Параметр выбора режима пагинации.
+PAGINATION_QUERY_PARAM = 'pagination'
+# Значение параметра для курсорной пагинации.
+CURSOR_PAGINATION = 'cursor'
 # Путь к файлу фикстур.
 PATH_TO_JSON = 'api/management/commands/ingredients.json'
+# Строк, импортируемых одной пачкой.
+IMPORT_BATCH_SIZE = 1000
+# Время жизни закэшированных ответов рецептов для анонимов, с.
+RECIPE_CACHE_TIMEOUT = 60 * 60
+# Максимум ингредиентов в выдаче автодополнения.
+AUTOCOMPLETE_LIMIT = 20
+# Минимальная длина запроса для поиска вхождений и опечаток.
+AUTOCOMPLETE_MIN_FUZZY_LENGTH = 3
+# Максимум опечаток в слове запроса автодополнения.
+AUTOCOMPLETE_TYPOS = 2
+# Порог триграммного сходства для запросов с опечатками.
+AUTOCOMPLETE_SIMILARITY = 0.3
+# Параметр формата файла списка покупок и формат по умолчанию.
+SHOPPING_LIST_FORMAT_PARAM = 'file_format'
+SHOPPING_LIST_DEFAULT_FORMAT = 'txt'
+# Время жизни закэшированного файла списка покупок, с.
+SHOPPING_LIST_CACHE_TIMEOUT = 24 * 60 * 60
+# Время жизни кода короткой ссылки в общем кэше, с.
+SHORT_LINK_CACHE_TIMEOUT = 24 * 60 * 60
+# Размер и время жизни LRU коротких ссылок в памяти воркера, с.
+SHORT_LINK_LOCAL_SIZE = 10000
+SHORT_LINK_LOCAL_TIMEOUT = 5 * 60
+# Наибольший размер загружаемого изображения, байт.
+MAX_IMAGE_SIZE = 10 * 2 ** 20
+# Наибольшее разрешение загружаемого изображения, пикселей.
+MAX_IMAGE_PIXELS = 40 * 10 ** 6
+# Сколько байт начала файла читать для проверки разрешения.
+MAX_IMAGE_HEADER_SIZE = 256 * 2 ** 10
+# Загрузки моложе этого возраста сборщик медиафайлов не трогает, ч.
+MEDIA_GC_MIN_AGE = 24
+# Имен файлов, проверяемых одним запросом к БД.
+MEDIA_GC_BATCH_SIZE = 1000
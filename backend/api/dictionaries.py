@@ -0,0 +1,138 @@
+"""Снимки справочников тэгов и ингредиентов в памяти воркера."""
+import gzip
+import re
+import threading
+import time
+from hashlib import sha1
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+from api.autocomplete import IngredientIndex
+from api.serializers import IngredientSerializer, TagSerializer
+from recipes.models import Ingredient, Tag
+
+# Ключ номера версии справочника в общем кэше.
+VERSION_KEY = 'dictionary:version:{name}'
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+
+class Snapshot:
+    """Заранее сериализованный и сжатый справочник."""
+
+    def __init__(self, name, version, data, index_class=None):
+        self.version = version
+        self.data = data
+        self.index = index_class(data) if index_class else None
+        self.by_id = {row['id']: row for row in data}
+        self.body = JSONRenderer().render(data)
+        self.gzipped = gzip.compress(self.body)
+        tag = f'{name}-{version}-{sha1(self.body).hexdigest()[:16]}'
+        # У сжатого и несжатого представлений разные ETag.
+        self.etag = f'"{tag}"'
+        self.gzip_etag = f'"{tag}-gz"'
+
+
+class Dictionary:
+    """
+    Справочник, который держится в памяти воркера.
+
+    Снимок пересобирается, только когда номер версии в общем кэше
+    отличается от версии снимка; версия меняется при записи в справочник.
+    """
+
+    def __init__(self, name, model, serializer_class, index_class=None):
+        self.name = name
+        self.model = model
+        self.serializer_class = serializer_class
+        self.index_class = index_class
+        self.version_key = VERSION_KEY.format(name=name)
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def get_version(self):
+        """Номер версии; отсутствующий заводится от текущего времени."""
+        version = cache.get(self.version_key)
+        if version is None:
+            version = time.time_ns()
+            if not cache.add(self.version_key, version, None):
+                version = cache.get(self.version_key, version)
+        return version
+
+    def bump_version(self):
+        """Смена версии после записи в справочник."""
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, time.time_ns(), None)
+
+    def get_snapshot(self):
+        """Актуальный снимок справочника."""
+        version = self.get_version()
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.version != version:
+                    data = self.serializer_class(
+                        self.model.objects.all(), many=True).data
+                    snapshot = Snapshot(self.name, version, data,
+                                        self.index_class)
+                    self._snapshot = snapshot
+        return snapshot
+
+    def in_bulk(self, ids):
+        """
+        Объекты справочника {id: объект} из снимка, без запросов.
+        Id, которых в снимке нет, добираются одним запросом IN.
+        """
+        snapshot = self.get_snapshot()
+        objects = {}
+        missing = []
+        for pk in ids:
+            row = snapshot.by_id.get(pk)
+            if row is None:
+                missing.append(pk)
+            else:
+                objects[pk] = self.model.from_db(
+                    DEFAULT_DB_ALIAS, list(row), list(row.values()))
+        if missing:
+            objects.update(self.model.objects.in_bulk(missing))
+        return objects
+
+    @staticmethod
+    def not_modified(request, etag):
+        """
+        Слабое сравнение ETag со списком If-None-Match,
+        как требует RFC 9110: префикс W/ не учитывается.
+        """
+        etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        return '*' in etags or any(
+            candidate.removeprefix('W/') == etag for candidate in etags)
+
+    def response(self, request):
+        """Ответ со снимком: 304 по ETag, gzip по Accept-Encoding."""
+        snapshot = self.get_snapshot()
+        if ACCEPTS_GZIP.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            etag, body = snapshot.gzip_etag, snapshot.gzipped
+        else:
+            etag, body = snapshot.etag, snapshot.body
+        if self.not_modified(request, etag):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type='application/json')
+            if body is snapshot.gzipped:
+                response['Content-Encoding'] = 'gzip'
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+tags = Dictionary('tags', Tag, TagSerializer)
+ingredients = Dictionary('ingredients', Ingredient, IngredientSerializer,
+                         IngredientIndex)
@@ -1,10 +1,18 @@
 from django.contrib.auth import get_user_model
 from django_filters.rest_framework import FilterSet, filters
+from rest_framework.exceptions import ValidationError
 
+from api.constants import CURSOR_PAGINATION, PAGINATION_QUERY_PARAM
 from recipes.models import Recipe, Tag
+from recipes.search import search_recipes
 
 User = get_user_model()
 
+# Курсорная пагинация сортирует по (-pub_date, -id) и потеряла бы
+# порядок по релевантности.
+SEARCH_WITH_CURSOR = ('Поиск недоступен с курсорной пагинацией: '
+                      'используйте постраничную.')
+
 
 class RecipeFilter(FilterSet):
     tags = filters.ModelMultipleChoiceFilter(
@@ -17,17 +25,27 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = filters.CharFilter(
+        method='filter_search'
+    )
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'search')
 
     def filter_is_favorited(self, queryset, name, value):
         if self.request.user.id and value:
-            return queryset.filter(favorites__user=self.request.user)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if self.request.user.id and value:
-            return queryset.filter(carts__user=self.request.user)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        if self.request.query_params.get(
+                PAGINATION_QUERY_PARAM) == CURSOR_PAGINATION:
+            raise ValidationError({name: [SEARCH_WITH_CURSOR]})
+        return search_recipes(queryset, value)
@@ -0,0 +1,71 @@
+import json
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.autocomplete import IngredientIndex
+from api.constants import AUTOCOMPLETE_LIMIT, PATH_TO_JSON
+from api.serializers import IngredientSerializer
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    """
+    Бенчмарк автодополнения ингредиентов: время поиска
+    на каждое нажатие клавиши при наборе названий с опечатками и без.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--names', type=int, default=200,
+                            help='сколько названий набирать')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        items = IngredientSerializer(
+            Ingredient.objects.all(), many=True).data
+        if not items:
+            with open(settings.BASE_DIR / PATH_TO_JSON,
+                      encoding='utf-8') as fixture:
+                items = [dict(row, id=position) for position, row
+                         in enumerate(json.load(fixture), 1)]
+        started = time.perf_counter()
+        index = IngredientIndex(items)
+        built = time.perf_counter() - started
+
+        generator = random.Random(options['seed'])
+        names = generator.sample(
+            index.names, min(options['names'], len(index.names)))
+        for title, queries in (
+                ('Набор без ошибок', names),
+                ('Набор с опечаткой', [self.typo(name, generator)
+                                       for name in names])):
+            timings = []
+            for query in queries:
+                for length in range(1, len(query) + 1):
+                    started = time.perf_counter_ns()
+                    index.search(query[:length], AUTOCOMPLETE_LIMIT)
+                    timings.append(
+                        (time.perf_counter_ns() - started) / 1000)
+            self.report(title, timings)
+        self.stdout.write(f'Построение индекса ({len(items)} шт.): '
+                          f'{built * 1000:.1f} мс')
+
+    @staticmethod
+    def typo(name, generator):
+        """Перестановка двух соседних букв в названии."""
+        if len(name) < 4:
+            return name
+        position = generator.randrange(1, len(name) - 2)
+        return (name[:position] + name[position + 1]
+                + name[position] + name[position + 2:])
+
+    def report(self, title, timings):
+        quantiles = statistics.quantiles(timings, n=100)
+        self.stdout.write(
+            f'{title}: {len(timings)} нажатий, мкс на нажатие - '
+            f'среднее {statistics.mean(timings):.0f}, '
+            f'p50 {quantiles[49]:.0f}, p95 {quantiles[94]:.0f}, '
+            f'p99 {quantiles[98]:.0f}, макс. {max(timings):.0f}')
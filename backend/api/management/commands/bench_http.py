@@ -0,0 +1,346 @@
+import http.client
+import json
+import random
+import subprocess
+import threading
+import time
+from datetime import datetime
+from itertools import count
+from unittest.mock import patch
+from urllib.parse import quote
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers import basehttp
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from rest_framework.authtoken.models import Token
+from rest_framework.views import APIView
+
+from recipes.models import Ingredient, Recipe, Tag
+from shortlink.models import ShortLink
+from user.models import User
+
+# Сценарии нагрузки и их доли в смеси.
+SCENARIOS = {
+    'recipe_list': 25,
+    'recipe_list_auth': 10,
+    'recipe_detail': 20,
+    'recipe_filter': 10,
+    'ingredient_search': 10,
+    'favorite_toggle': 5,
+    'cart_toggle': 5,
+    'subscriptions': 5,
+    'shopping_list': 3,
+    'short_link': 7,
+}
+PERCENTILES = (50, 95, 99)
+# Заголовок запроса, по которому сервер сопоставляет число запросов к БД.
+BENCH_ID_HEADER = 'X-Bench-Id'
+
+
+class QuietHandler(basehttp.WSGIRequestHandler):
+    """Обработчик без журнала запросов и задержки Нейгла."""
+
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+
+class QueryCounter:
+    """
+    WSGI-обертка: число запросов к БД на каждый HTTP-запрос.
+    Тело ответа читается внутри обертки, чтобы учесть запросы
+    потоковых ответов.
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self.queries = {}
+
+    def __call__(self, environ, start_response):
+        executed = 0
+
+        def counter(execute, *args):
+            nonlocal executed
+            executed += 1
+            return execute(*args)
+
+        with connection.execute_wrapper(counter):
+            response = self.application(environ, start_response)
+            try:
+                body = b''.join(response)
+            finally:
+                response.close()
+        self.queries[environ.get('HTTP_X_BENCH_ID')] = executed
+        return [body]
+
+
+def percentile(values, rank):
+    """Процентиль отсортированного списка."""
+    return values[round(rank / 100 * (len(values) - 1))]
+
+
+def is_error(status):
+    """
+    Ошибка запроса: нет ответа, 5xx, отказ в доступе или 404;
+    400 - обычный ответ на повторное добавление в избранное.
+    """
+    return not status or status >= 500 or status in (401, 403, 404)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Worker:
+    """Поток нагрузки от имени одного пользователя."""
+
+    def __init__(self, port, token, data, seed, ids):
+        self.connection = http.client.HTTPConnection('127.0.0.1', port)
+        self.headers = {'Authorization': f'Token {token}'}
+        self.data = data
+        self.random = random.Random(seed)
+        self.ids = ids
+        self.results = []
+
+    def request(self, label, method, path, auth=True):
+        bench_id = str(next(self.ids))
+        headers = {BENCH_ID_HEADER: bench_id}
+        if auth:
+            headers.update(self.headers)
+        started = time.perf_counter()
+        try:
+            self.connection.request(method, path, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            # Ошибка соединения считается ошибкой запроса.
+            self.connection.close()
+            status = 0
+        self.results.append((label, time.perf_counter() - started,
+                             status, bench_id))
+        return status
+
+    def run(self, deadline):
+        names = list(SCENARIOS)
+        weights = list(SCENARIOS.values())
+        while time.perf_counter() < deadline:
+            scenario = self.random.choices(names, weights)[0]
+            getattr(self, scenario)()
+        self.connection.close()
+
+    def recipe_id(self):
+        return self.random.choice(self.data['recipes'])
+
+    def recipe_list(self):
+        page = self.random.randint(1, 20)
+        self.request('recipe_list', 'GET', f'/api/recipes/?page={page}',
+                     auth=False)
+
+    def recipe_list_auth(self):
+        self.request('recipe_list_auth', 'GET', '/api/recipes/')
+
+    def recipe_detail(self):
+        self.request('recipe_detail', 'GET',
+                     f'/api/recipes/{self.recipe_id()}/')
+
+    def recipe_filter(self):
+        query = self.random.choice((
+            f'tags={self.random.choice(self.data["tags"])}',
+            f'author={self.random.choice(self.data["authors"])}',
+            'is_favorited=1',
+            'is_in_shopping_cart=1'))
+        self.request('recipe_filter', 'GET', f'/api/recipes/?{query}')
+
+    def ingredient_search(self):
+        prefix = self.random.choice(self.data['prefixes'])
+        self.request('ingredient_search', 'GET',
+                     f'/api/ingredients/?name={quote(prefix)}', auth=False)
+
+    def toggle(self, label, action):
+        # Удаляется только то, что добавлено здесь: данные не меняются.
+        path = f'/api/recipes/{self.recipe_id()}/{action}/'
+        if self.request(f'{label}_add', 'POST', path) == 201:
+            self.request(f'{label}_remove', 'DELETE', path)
+
+    def favorite_toggle(self):
+        self.toggle('favorite', 'favorite')
+
+    def cart_toggle(self):
+        self.toggle('cart', 'shopping_cart')
+
+    def subscriptions(self):
+        self.request('subscriptions', 'GET',
+                     '/api/users/subscriptions/?recipes_limit=3')
+
+    def shopping_list(self):
+        self.request('shopping_list', 'GET',
+                     '/api/recipes/download_shopping_cart/')
+
+    def short_link(self):
+        code = self.random.choice(self.data['codes'])
+        self.request('short_link', 'GET', f'/s/{code}/', auth=False)
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочный бенчмарк API по HTTP: WSGI-приложение запускается
+    на локальном многопоточном сервере поверх текущей БД (заполните
+    ее generate_data), потоки выполняют взвешенную смесь сценариев.
+    Отчет: запросов в секунду, p50/p95/p99 и запросов к БД на запрос;
+    результаты сохраняются в JSON и сравниваются с прошлым прогоном.
+    Ограничение частоты запросов на время прогона отключается.
+
+    Прогон пишет в БД: созданные для него токены удаляются в конце,
+    короткие ссылки рецептов остаются (те же, что выдал бы get-link),
+    а избранное и корзины пользователей меняются сценариями.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=30,
+                            help='длительность замера, с')
+        parser.add_argument('--warmup', type=float, default=3,
+                            help='прогрев перед замером, с')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='сохранить результаты в JSON')
+        parser.add_argument('--compare',
+                            help='JSON прошлого прогона для сравнения')
+
+    def handle(self, *args, **options):
+        data, created_tokens = self.prepare(options['concurrency'])
+        application = QueryCounter(get_wsgi_application())
+        server = basehttp.ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler)
+        server.set_app(application)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        port = server.server_address[1]
+        try:
+            with patch.object(APIView, 'throttle_classes', ()):
+                self.load(port, data, options['warmup'], options['seed'])
+                started = time.perf_counter()
+                results = self.load(port, data, options['duration'],
+                                    options['seed'] + 1)
+                elapsed = time.perf_counter() - started
+        finally:
+            server.shutdown()
+            server.server_close()
+            Token.objects.filter(key__in=created_tokens).delete()
+        report = self.report(results, application.queries, elapsed, options)
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                self.compare(json.load(file), report)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+
+    def prepare(self, concurrency):
+        """
+        Данные для запросов и токены пользователей потоков;
+        вторым значением - ключи токенов, созданных для прогона.
+        """
+        recipes = list(Recipe.objects.values_list('id', flat=True)[:10000])
+        if not recipes:
+            raise CommandError('В БД нет рецептов, заполните ее '
+                               'командой generate_data.')
+        users = list(User.objects.filter(carts__isnull=False).distinct()[
+            :concurrency]) or list(User.objects.all()[:concurrency])
+        names = Ingredient.objects.values_list('name', flat=True)[:500]
+        tokens = [Token.objects.get_or_create(user=user)
+                  for user in users]
+        return {
+            'recipes': recipes,
+            'authors': list(Recipe.objects.values_list(
+                'author_id', flat=True).distinct()[:1000]),
+            'tags': list(Tag.objects.values_list('slug', flat=True)),
+            'prefixes': sorted({name[:3] for name in names}) or ['сол'],
+            'codes': [ShortLink.objects.for_recipe(recipe_id)
+                      for recipe_id in recipes[:200]],
+            'tokens': [token.key for token, _ in tokens],
+        }, [token.key for token, created in tokens if created]
+
+    @staticmethod
+    def load(port, data, duration, seed):
+        """Нагрузка на duration секунд; результаты всех потоков."""
+        ids = count()
+        tokens = data['tokens']
+        workers = [Worker(port, tokens[number % len(tokens)], data,
+                          seed * 1000 + number, ids)
+                   for number in range(len(tokens))]
+        deadline = time.perf_counter() + duration
+        threads = [threading.Thread(target=worker.run, args=(deadline,))
+                   for worker in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return [result for worker in workers for result in worker.results]
+
+    def report(self, results, queries, elapsed, options):
+        labels = {}
+        for label, latency, status, bench_id in results:
+            labels.setdefault(label, []).append(
+                (latency, status, queries.get(bench_id, 0)))
+        report = {
+            'commit': git_commit(),
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'concurrency': options['concurrency'],
+            'duration': round(elapsed, 1),
+            'total': self.summary(
+                [row for rows in labels.values() for row in rows], elapsed),
+            'scenarios': {label: self.summary(rows, elapsed)
+                          for label, rows in sorted(labels.items())},
+        }
+        self.stdout.write(
+            f'{"сценарий":<22}{"запросов":>9}{"ошибок":>8}{"req/s":>9}'
+            + ''.join(f'{f"p{rank}, мс":>10}' for rank in PERCENTILES)
+            + f'{"SQL":>7}')
+        for label, row in (*report['scenarios'].items(),
+                           ('всего', report['total'])):
+            self.stdout.write(
+                f'{label:<22}{row["requests"]:>9}{row["errors"]:>8}'
+                f'{row["rps"]:>9.1f}'
+                + ''.join(f'{row[f"p{rank}"]:>10.1f}'
+                          for rank in PERCENTILES)
+                + f'{row["queries"]:>7.1f}')
+        return report
+
+    @staticmethod
+    def summary(rows, elapsed):
+        if not rows:
+            # Ни одного ответа за замер: сервер не успел ответить.
+            return {'requests': 0, 'errors': 0, 'rps': 0, 'queries': 0,
+                    **{f'p{rank}': 0 for rank in PERCENTILES}}
+        latencies = sorted(latency * 1000 for latency, _, _ in rows)
+        summary = {
+            'requests': len(rows),
+            'errors': sum(is_error(status) for _, status, _ in rows),
+            'rps': round(len(rows) / elapsed, 1),
+            'queries': round(
+                sum(queries for _, _, queries in rows) / len(rows), 2),
+        }
+        for rank in PERCENTILES:
+            summary[f'p{rank}'] = round(percentile(latencies, rank), 2)
+        return summary
+
+    def compare(self, old, new):
+        self.stdout.write(
+            f'\nСравнение с {old.get("commit") or "прошлым прогоном"}:')
+        for label, row in (*new['scenarios'].items(),
+                           ('всего', new['total'])):
+            before = (old['total'] if label == 'всего'
+                      else old['scenarios'].get(label))
+            if not before:
+                continue
+            changes = ', '.join(
+                f'{key} {before[key]:g} -> {row[key]:g} '
+                f'({(row[key] - before[key]) / before[key]:+.0%})'
+                for key in ('rps', 'p95', 'queries') if before[key])
+            self.stdout.write(f'{label}: {changes}')
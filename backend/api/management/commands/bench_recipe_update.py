@@ -0,0 +1,170 @@
+import random
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import override_settings
+from rest_framework import serializers
+
+from api.serializers import RecipeSerializer
+from api.views import RecipeViewSet
+from recipes import cart_totals
+from recipes.models import Cart, Ingredient, IngredientRecipe, Recipe, Tag
+from recipes.search import update_search_index
+from user.models import User
+
+# Картинка 1x1: поле фото обязательно при правке.
+IMAGE = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1Pe'
+         'AAAADElEQVR4nGNgYGAAAAAEAAH2FzhVAAAAAElFTkSuQmCC')
+WRITES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+class LegacyRecipeSerializer(RecipeSerializer):
+    """
+    Прежняя правка: состав и тэги удаляются и вставляются заново,
+    старый состав вычитается из итогов корзин, новый прибавляется.
+    """
+
+    def update(self, instance, validated_data):
+        ingredients = validated_data.pop('ingredients')
+        tags = validated_data.pop('tags')
+        cart_totals.apply_recipe(instance.id, -1)
+        instance.ingredients.clear()
+        instance.tags.clear()
+        self._add_ingredients(IngredientRecipe, instance, ingredients, tags)
+        cart_totals.apply_recipe(instance.id, 1)
+        recipe = serializers.ModelSerializer.update(
+            self, instance, validated_data)
+        update_search_index([recipe.id])
+        return recipe
+
+
+SERIALIZERS = {
+    'очистка и вставка': LegacyRecipeSerializer,
+    'по разнице': RecipeSerializer,
+}
+
+
+class WriteCounter:
+    """Запросы, команды записи и затронутые ими строки."""
+
+    def __init__(self):
+        self.queries = self.writes = self.rows = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        self.queries += 1
+        if sql.lstrip().upper().startswith(WRITES):
+            self.writes += 1
+            self.rows += max(context['cursor'].rowcount, 0)
+        return result
+
+
+class Command(BaseCommand):
+    """
+    Бенчмарк правки рецепта с большим составом: прежняя очистка
+    и вставка против записи по разнице. Для каждой правки - число
+    запросов, команд записи, затронутых строк (вместе с итогами
+    корзин и поисковым индексом) и медиана времени. Данные создаются
+    в транзакции и откатываются.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ingredients', type=int, default=40,
+                            help='ингредиентов в рецепте')
+        parser.add_argument('--carts', type=int, default=100,
+                            help='корзин с рецептом')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        generator = random.Random(options['seed'])
+        size = options['ingredients']
+        with tempfile.TemporaryDirectory() as media, override_settings(
+                MEDIA_ROOT=media), transaction.atomic():
+            recipe, ingredients, tags = self.prepare(generator, size,
+                                                     options['carts'])
+            composition = [(row.ingredient_id, row.amount)
+                           for row in recipe.ingredient_recipe.all()]
+            spare = [ingredient.id for ingredient in ingredients[size:]]
+            edits = {
+                'одно количество': [(composition[0][0],
+                                     composition[0][1] + 1),
+                                    *composition[1:]],
+                'замена 5 ингредиентов': composition[:-5] + [
+                    (ingredient_id, 10) for ingredient_id in spare[:5]],
+                'без изменений': composition,
+            }
+            self.stdout.write(
+                f'Рецепт: {size} ингредиентов, {options["carts"]} корзин')
+            self.stdout.write(
+                f'{"правка":<24}{"способ":<20}{"запросов":>9}'
+                f'{"записей":>9}{"строк":>8}{"мс":>8}')
+            for title, edit in edits.items():
+                data = {
+                    'ingredients': [{'id': ingredient_id, 'amount': amount}
+                                    for ingredient_id, amount in edit],
+                    'tags': [tag.id for tag in tags], 'image': IMAGE,
+                    'name': recipe.name, 'text': recipe.text,
+                    'cooking_time': recipe.cooking_time}
+                for name, serializer_class in SERIALIZERS.items():
+                    counter, latency = self.measure(
+                        serializer_class, recipe, data, options['repeat'])
+                    self.stdout.write(
+                        f'{title:<24}{name:<20}{counter.queries:>9}'
+                        f'{counter.writes:>9}{counter.rows:>8}'
+                        f'{latency:>8.2f}')
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def prepare(generator, size, carts):
+        """Рецепт из size ингредиентов в корзинах carts пользователей."""
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'bench ингредиент {number}',
+                       measurement_unit='г')
+            for number in range(size + 10))
+        tags = Tag.objects.bulk_create(
+            Tag(name=f'bench тэг {number}', slug=f'bench_tag_{number}')
+            for number in range(3))
+        author = User.objects.create(
+            username='bench_author', email='bench_author@foodgram.ru')
+        recipe = Recipe.objects.create(
+            author=author, name='bench рецепт', text='bench',
+            image='recipes/bench.png')
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                             amount=generator.randint(1, 500))
+            for ingredient in ingredients[:size])
+        recipe.tags.set(tags)
+        users = User.objects.bulk_create(
+            User(username=f'bench_{number}',
+                 email=f'bench_{number}@foodgram.ru')
+            for number in range(carts))
+        Cart.objects.bulk_create(Cart(user=user, recipe=recipe)
+                                 for user in users)
+        # bulk_create не вызывает сигналы: итоги и индекс считаются явно.
+        cart_totals.rebuild([user.id for user in users])
+        update_search_index([recipe.id])
+        return RecipeViewSet.queryset.get(pk=recipe.pk), ingredients, tags
+
+    @staticmethod
+    def measure(serializer_class, recipe, data, repeat):
+        """
+        Правка в точке сохранения, которая откатывается: каждый
+        повтор начинается с одного и того же состава.
+        """
+        timings = []
+        for _ in range(repeat):
+            instance = RecipeViewSet.queryset.get(pk=recipe.pk)
+            counter = WriteCounter()
+            with transaction.atomic(), connection.execute_wrapper(counter):
+                started = time.perf_counter()
+                serializer = serializer_class(
+                    instance, data=data, context={'request': None})
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+                timings.append((time.perf_counter() - started) * 1000)
+                transaction.set_rollback(True)
+        return counter, statistics.median(timings)
@@ -0,0 +1,108 @@
+import random
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes import cart_totals
+from recipes.models import Cart, Ingredient, IngredientRecipe, Recipe
+from recipes.shopping_list import cart_ingredients
+from user.models import User
+
+
+def aggregate_cart_ingredients(user):
+    """
+    Базовая линия: суммы ингредиентов корзины одним сгруппированным
+    запросом по составу рецептов, без таблицы итогов.
+    """
+    return IngredientRecipe.objects.filter(
+        recipe__in=Cart.objects.filter(user=user).values('recipe')
+    ).values_list(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).annotate(
+        amount=Sum('amount')
+    ).order_by('ingredient__name', 'ingredient__measurement_unit')
+
+
+class Command(BaseCommand):
+    """
+    Бенчмарк чтения списка покупок на корзинах разного размера:
+    время запроса и сверка сумм с подсчетом в Python.
+    Данные создаются в транзакции и откатываются.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[10, 100, 1000],
+                            help='количество рецептов в корзине')
+        parser.add_argument('--ingredients', type=int, default=10,
+                            help='ингредиентов в рецепте')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        generator = random.Random(options['seed'])
+        with transaction.atomic():
+            ingredients = Ingredient.objects.bulk_create(
+                Ingredient(name=f'bench ингредиент {number}',
+                           measurement_unit='г')
+                for number in range(max(options['ingredients'] * 5, 50)))
+            author = User.objects.create(
+                username='bench_author', email='bench_author@foodgram.ru')
+            for size in options['sizes']:
+                user = User.objects.create(username=f'bench_{size}',
+                                           email=f'bench_{size}@foodgram.ru')
+                expected = self.fill_cart(generator, author, user, size,
+                                          ingredients, options['ingredients'])
+                self.report(size, user, expected, options['repeat'])
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def fill_cart(generator, author, user, size, ingredients, per_recipe):
+        """
+        Корзина из size рецептов (последний - без ингредиентов);
+        ожидаемые суммы по ингредиентам.
+        """
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=author, name=f'bench {user.username} {number}',
+                   text='bench', image='recipes/bench.png')
+            for number in range(size))
+        expected = Counter()
+        rows = []
+        for recipe in recipes[:-1]:
+            for ingredient in generator.sample(ingredients, per_recipe):
+                amount = generator.randint(1, 500)
+                expected[(ingredient.name, ingredient.measurement_unit)] += (
+                    amount)
+                rows.append(IngredientRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=amount))
+        IngredientRecipe.objects.bulk_create(rows)
+        Cart.objects.bulk_create(Cart(user=user, recipe=recipe)
+                                 for recipe in recipes)
+        # bulk_create не вызывает сигналы: итоги считаются явно.
+        cart_totals.rebuild([user.id])
+        return expected
+
+    def report(self, size, user, expected, repeat):
+        legacy = Cart.objects.filter(user=user).values_list(
+            'recipe__ingredients__name',
+            'recipe__ingredients__measurement_unit').annotate(
+            amount=Sum('recipe__ingredient_recipe__amount'))
+        for title, queryset in (
+                ('прежний запрос', legacy),
+                ('агрегация состава', aggregate_cart_ingredients(user)),
+                ('таблица итогов', cart_ingredients(user))):
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                rows = list(queryset.all())
+                timings.append(time.perf_counter() - started)
+            totals = {(name, unit): amount for name, unit, amount in rows}
+            correct = totals == dict(expected)
+            self.stdout.write(
+                f'{size} рецептов, {title}: '
+                f'{min(timings) * 1000:.1f} мс, строк {len(rows)}, '
+                + (self.style.SUCCESS('суммы верны') if correct
+                   else self.style.ERROR('суммы неверны')))
@@ -0,0 +1,66 @@
+import random
+import statistics
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+
+from shortlink.cache import SHORT_LINK_KEY, local_links
+from shortlink.codes import encode
+from shortlink.models import ShortLink
+
+
+class Command(BaseCommand):
+    """
+    Бенчмарк переадресации по коротким ссылкам: запросов в секунду
+    на один воркер при чтении из БД, общего кэша и LRU воркера.
+    Ссылки создаются в транзакции и откатываются.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--links', type=int, default=1000)
+        parser.add_argument('--requests', type=int, default=3000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        generator = random.Random(options['seed'])
+        client = Client()
+        with transaction.atomic():
+            codes = [f'bench{encode(number, 4)}'
+                     for number in range(options['links'])]
+            ShortLink.objects.bulk_create(
+                ShortLink(full=f'/bench/{code}/', short=code)
+                for code in codes)
+            requests = [generator.choice(codes)
+                        for _ in range(options['requests'])]
+            # Режим: (название, сбрасывать LRU, сбрасывать общий кэш).
+            for title, reset_local, reset_shared in (
+                    ('БД', True, True),
+                    ('общий кэш', True, False),
+                    ('LRU воркера', False, False)):
+                self.reset_all(codes)
+                for code in codes:  # Прогрев кэшей.
+                    client.get(f'/s/{code}/')
+                timings = []
+                for code in requests:
+                    if reset_local:
+                        local_links.clear()
+                    if reset_shared:
+                        cache.delete(SHORT_LINK_KEY.format(code=code))
+                    started = time.perf_counter()
+                    response = client.get(f'/s/{code}/')
+                    timings.append(time.perf_counter() - started)
+                    assert response.status_code == 301, response.status_code
+                self.stdout.write(
+                    f'{title}: {len(timings) / sum(timings):.0f} запросов/с, '
+                    f'медиана {statistics.median(timings) * 1e6:.0f} мкс')
+            self.reset_all(codes)
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def reset_all(codes):
+        local_links.clear()
+        cache.delete_many([SHORT_LINK_KEY.format(code=code)
+                           for code in codes])
@@ -0,0 +1,135 @@
+import base64
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import transaction
+from django.test import RequestFactory, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from PIL import Image
+from rest_framework.test import force_authenticate
+
+from user.models import User
+from user.views import UserViewSet
+
+# Режимы загрузки: название -> Content-Type тела запроса.
+MODES = {
+    'base64 в JSON': 'application/json',
+    'multipart': MULTIPART_CONTENT,
+    'файл телом запроса': 'image/jpeg',
+}
+
+
+def make_body(mode, image):
+    """Тело запроса загрузки аватара в заданном режиме."""
+    if mode == 'base64 в JSON':
+        return json.dumps({'avatar': 'data:image/jpeg;base64,'
+                           + base64.b64encode(image).decode()}).encode()
+    if mode == 'multipart':
+        upload = BytesIO(image)
+        upload.name = 'avatar.jpg'
+        return encode_multipart(BOUNDARY, {'avatar': upload})
+    return image
+
+
+def memory_status(field):
+    """Поле /proc/self/status (VmRSS, VmHWM), МБ."""
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) / 1024
+    raise CommandError('Нужен Linux с /proc/self/status.')
+
+
+def reset_peak_rss():
+    """Сброс пикового RSS (VmHWM) до текущего, Linux 4.0+."""
+    with open('/proc/self/clear_refs', 'w') as clear_refs:
+        clear_refs.write('5')
+
+
+class Command(BaseCommand):
+    """
+    Бенчмарк памяти при загрузке аватара: прирост пикового RSS
+    на одну загрузку в каждом режиме. Каждый режим меряется
+    в отдельном процессе после прогрева, тело запроса читается
+    из файла, как из сокета.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--width', type=int, default=3000)
+        parser.add_argument('--height', type=int, default=2000)
+        parser.add_argument('--run', nargs=2, metavar=('BODY', 'TYPE'),
+                            help='служебный: одна загрузка в процессе')
+
+    def handle(self, *args, **options):
+        if options['run']:
+            self.run(*options['run'])
+            return
+        size = (options['width'], options['height'])
+        buffer = BytesIO()
+        Image.effect_noise(size, 40).convert('RGB').save(
+            buffer, 'JPEG', quality=90)
+        image = buffer.getvalue()
+        self.stdout.write(f'Изображение {size[0]}x{size[1]}, '
+                          f'{len(image) / 2 ** 20:.1f} МБ')
+        with tempfile.TemporaryDirectory() as directory:
+            for mode, content_type in MODES.items():
+                path = os.path.join(directory, 'body')
+                with open(path, 'wb') as body:
+                    body.write(make_body(mode, image))
+                result = subprocess.run(
+                    [sys.executable, sys.argv[0], 'bench_upload_memory',
+                     '--run', path, content_type],
+                    capture_output=True, text=True)
+                if result.returncode:
+                    raise CommandError(f'{mode}: {result.stderr}')
+                self.stdout.write(
+                    f'{mode}: тело {os.path.getsize(path) / 2 ** 20:.1f} МБ, '
+                    f'прирост пикового RSS {result.stdout.strip()} МБ')
+
+    def run(self, path, content_type):
+        with tempfile.TemporaryDirectory() as media, override_settings(
+                MEDIA_ROOT=media,
+                # Иначе base64 больше 2,5 МБ отклоняется целиком.
+                DATA_UPLOAD_MAX_MEMORY_SIZE=None), transaction.atomic():
+            user = User.objects.create(
+                username='bench_upload', email='bench_upload@foodgram.ru')
+            view = UserViewSet.as_view(
+                {'put': 'avatar'}, **UserViewSet.avatar.kwargs)
+            # Прогрев: импорты и кэши на маленьком файле.
+            with open(path + '.warmup', 'wb') as body:
+                small = BytesIO()
+                Image.new('RGB', (1, 1)).save(small, 'JPEG')
+                body.write(make_body(
+                    next(mode for mode, value in MODES.items()
+                         if value == content_type), small.getvalue()))
+            self.upload(view, user, path + '.warmup', content_type)
+            gc.collect()
+            reset_peak_rss()
+            before = memory_status('VmRSS')
+            status_code = self.upload(view, user, path, content_type)
+            after = memory_status('VmHWM')
+            transaction.set_rollback(True)
+        assert status_code == 200, status_code
+        self.stdout.write(f'{after - before:.1f}')
+
+    @staticmethod
+    def upload(view, user, path, content_type):
+        with open(path, 'rb') as body:
+            environ = RequestFactory()._base_environ(
+                PATH_INFO='/api/users/me/avatar/', REQUEST_METHOD='PUT',
+                CONTENT_TYPE=content_type,
+                CONTENT_LENGTH=str(os.path.getsize(path)))
+            environ['wsgi.input'] = body
+            request = WSGIRequest(environ)
+            force_authenticate(request, user)
+            response = view(request)
+            response.render()
+            request.close()
+            return response.status_code
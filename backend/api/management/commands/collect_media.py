@@ -0,0 +1,120 @@
+import os
+import shutil
+import time
+from functools import reduce
+from itertools import islice
+from operator import or_
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from api.constants import MEDIA_GC_BATCH_SIZE, MEDIA_GC_MIN_AGE
+from recipes.images import VARIANTS_PATH
+from recipes.models import Recipe
+from user.models import User
+
+# Поля с загрузками: модель и имя поля.
+FIELDS = ((Recipe, 'image'), (User, 'avatar'))
+# Каталог уменьшенных копий фото рецептов, в нем папка на каждое фото.
+VARIANTS_ROOT = VARIANTS_PATH.split('{')[0].rstrip('/')
+
+
+def batches(iterable, size):
+    """Список за списком по size элементов."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def scan(root, directories=False):
+    """Файлы (или папки) каталога по одному, без списка целиком."""
+    if not os.path.isdir(root):
+        return
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir() if directories else entry.is_file():
+                yield entry
+
+
+class Command(BaseCommand):
+    """
+    Удаление медиафайлов, на которые не ссылается ни одна строка:
+    каталоги загрузок читаются потоком, ссылки проверяются пачками
+    имен. Свежие файлы не трогаются - строка с ними может быть
+    еще не записана.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='только показать, что будет удалено')
+        parser.add_argument('--min-age', type=float,
+                            default=MEDIA_GC_MIN_AGE,
+                            help='не трогать файлы моложе, ч')
+        parser.add_argument('--batch-size', type=int,
+                            default=MEDIA_GC_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.verbosity = options['verbosity']
+        self.deadline = time.time() - options['min_age'] * 60 * 60
+        self.removed = self.freed = 0
+        size = options['batch_size']
+        for model, field_name in FIELDS:
+            field = model._meta.get_field(field_name)
+            directory = field.upload_to.rstrip('/')
+            entries = (entry for entry in scan(field.storage.path(directory))
+                       if self.is_old(entry.path))
+            for batch in batches(entries, size):
+                names = {f'{directory}/{entry.name}': entry
+                         for entry in batch}
+                used = set(model.objects.filter(
+                    **{f'{field_name}__in': names}
+                ).values_list(field_name, flat=True))
+                for name, entry in names.items():
+                    if name not in used:
+                        self.remove(name, entry.path)
+        self.collect_variants(Recipe._meta.get_field('image'), size)
+        verb = 'Будет удалено' if self.dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} файлов и папок: {self.removed}, '
+            f'{self.freed / 2 ** 20:.1f} МБ'))
+
+    def collect_variants(self, field, size):
+        """Папки копий фото, которого нет ни у одного рецепта."""
+        directory = field.upload_to.rstrip('/')
+        entries = (entry for entry in scan(
+            field.storage.path(VARIANTS_ROOT), directories=True)
+            if self.is_old(entry.path))
+        for batch in batches(entries, size):
+            used = {
+                os.path.splitext(os.path.basename(name))[0]
+                for name in Recipe.objects.filter(reduce(or_, (
+                    Q(image__startswith=f'{directory}/{entry.name}.')
+                    for entry in batch))).values_list('image', flat=True)}
+            for entry in batch:
+                if entry.name not in used:
+                    self.remove(f'{VARIANTS_ROOT}/{entry.name}/', entry.path)
+
+    def is_old(self, path):
+        """Файл не менялся дольше --min-age (его не загрузили заново)."""
+        try:
+            return os.stat(path).st_mtime < self.deadline
+        except FileNotFoundError:
+            return False
+
+    def remove(self, name, path):
+        # Проверка еще раз: файл могли загрузить повторно за время пачки.
+        if not self.is_old(path):
+            return
+        if os.path.isdir(path):
+            size = sum(entry.stat().st_size for entry in scan(path))
+            if not self.dry_run:
+                shutil.rmtree(path, ignore_errors=True)
+        else:
+            size = os.path.getsize(path)
+            if not self.dry_run:
+                os.remove(path)
+        self.removed += 1
+        self.freed += size
+        if self.verbosity > 1 or self.dry_run:
+            self.stdout.write(name)
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from recipes.models import Recipe
+from shortlink.codes import short_code
+from shortlink.models import ShortLink, recipe_path
+
+BATCH_SIZE = 1000
+INSERT_LINKS = '''
+    INSERT INTO shortlink_shortlink ("full", short)
+    VALUES {values}
+    ON CONFLICT DO NOTHING
+    RETURNING short
+'''
+
+
+class Command(BaseCommand):
+    """Создание коротких ссылок для рецептов, у которых их еще нет."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        fulls = set()
+        taken = set()
+        for full, short in ShortLink.objects.values_list(
+                'full', 'short').iterator():
+            fulls.add(full)
+            taken.add(short)
+        links = []
+        created = 0
+        for recipe_id in Recipe.objects.order_by('id').values_list(
+                'id', flat=True).iterator():
+            full = recipe_path(recipe_id)
+            if full in fulls:
+                continue
+            code = short_code(recipe_id, taken.__contains__)
+            taken.add(code)
+            links.append((full, code))
+            if len(links) >= options['batch_size']:
+                created += self.save(links)
+        created += self.save(links)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано коротких ссылок: {created}'))
+
+    @staticmethod
+    def save(links):
+        """
+        Запись пачки ссылок; уже созданные параллельно пропускаются.
+        Возвращает число созданных строк: RETURNING отдает только их.
+        """
+        if not links:
+            return 0
+        values = ', '.join(['(%s, %s)'] * len(links))
+        with connection.cursor() as cursor:
+            cursor.execute(INSERT_LINKS.format(values=values),
+                           [value for link in links for value in link])
+            created = len(cursor.fetchall())
+        links.clear()
+        return created
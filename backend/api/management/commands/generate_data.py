@@ -0,0 +1,223 @@
+import io
+import random
+import time
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from PIL import Image
+
+from api.cache import invalidate_all
+from recipes import cart_totals
+from recipes.images import render_variants
+from recipes.models import (Cart, Favorite, Ingredient, IngredientRecipe,
+                            Recipe, Tag)
+from recipes.search import update_search_index
+from user.models import Follow, User
+
+# Тэги, которые создаются, если справочник пуст.
+DEFAULT_TAGS = (('Завтрак', 'breakfast'), ('Обед', 'lunch'),
+                ('Ужин', 'dinner'))
+PASSWORD = 'loadtest-password'
+DISHES = ('Салат', 'Суп', 'Рагу', 'Запеканка', 'Паста', 'Пирог', 'Омлет',
+          'Каша', 'Плов', 'Соус')
+TEXT = ('Подготовьте продукты. Смешайте {first} и {second}, '
+        'готовьте на среднем огне, подавайте горячим.')
+
+
+def zipf(population, skew):
+    """Накопленные веса Zipf: первый элемент популярнее всех."""
+    return list(accumulate(1 / rank ** skew
+                           for rank in range(1, len(population) + 1)))
+
+
+class Command(BaseCommand):
+    """
+    Синтетические данные для нагрузочного тестирования: пользователи,
+    рецепты из реального справочника ингредиентов, избранное, корзины
+    и подписки. Популярность рецептов, авторов и ингредиентов
+    распределена по Zipf; при одном --seed данные на пустой базе
+    совпадают. Строки пишутся bulk_create пачками.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--favorites', type=int, default=50000)
+        parser.add_argument('--carts', type=int, default=20000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument('--ingredients', type=int, nargs=2,
+                            default=(3, 15), metavar=('MIN', 'MAX'),
+                            help='ингредиентов в рецепте')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='показатель распределения Zipf')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.skew = options['skew']
+        self.batch_size = options['batch_size']
+        ingredient_ids = list(Ingredient.objects.order_by('id').values_list(
+            'id', flat=True))
+        if not ingredient_ids:
+            raise CommandError('Справочник ингредиентов пуст, '
+                               'сначала выполните import_json.')
+        if not Tag.objects.exists():
+            for name, slug in DEFAULT_TAGS:
+                Tag.objects.create(name=name, slug=slug)
+        self.tag_ids = list(Tag.objects.order_by('id').values_list(
+            'id', flat=True))
+        self.random.shuffle(ingredient_ids)
+        self.ingredient_ids = ingredient_ids
+        self.ingredient_weights = zipf(ingredient_ids, self.skew)
+        self.names = dict(Ingredient.objects.values_list('id', 'name'))
+        started = time.perf_counter()
+
+        user_ids = self.step('Пользователи', self.create_users,
+                             options['users'])
+        authors = self.random.sample(user_ids, len(user_ids))
+        recipe_ids = self.step('Рецепты', self.create_recipes,
+                               options['recipes'], authors,
+                               options['ingredients'])
+        popular = self.random.sample(recipe_ids, len(recipe_ids))
+        for title, model, field, count, targets in (
+                ('Избранное', Favorite, 'recipe_id', options['favorites'],
+                 popular),
+                ('Корзины', Cart, 'recipe_id', options['carts'], popular),
+                ('Подписки', Follow, 'author_id', options['follows'],
+                 authors)):
+            self.step(title, self.create_pairs, model, field, count,
+                      user_ids, targets)
+        self.step('Итоги корзин и поисковый индекс', self.finish)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - started:.1f} с'))
+
+    def step(self, title, function, *args):
+        started = time.perf_counter()
+        result = function(*args)
+        rows = len(result) if isinstance(result, list) else result
+        rows = f', строк: {rows}' if rows is not None else ''
+        self.stdout.write(
+            f'{title}{rows} - {time.perf_counter() - started:.1f} с')
+        return result
+
+    def batches(self, count):
+        """Диапазоны номеров по batch_size."""
+        for start in range(0, count, self.batch_size):
+            yield range(start, min(start + self.batch_size, count))
+
+    def create_users(self, count):
+        # Хэш пароля считается один раз: это самая медленная часть.
+        password = make_password(PASSWORD)
+        offset = (User.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+        user_ids = []
+        for numbers in self.batches(count):
+            users = User.objects.bulk_create(
+                User(username=f'loadtest_{offset + number}',
+                     email=f'loadtest_{offset + number}@foodgram.ru',
+                     first_name='Тест', last_name=f'Пользователь {number}',
+                     password=password)
+                for number in numbers)
+            user_ids.extend(user.id for user in users)
+        return user_ids
+
+    def recipe_image(self):
+        """
+        Одно фото на все рецепты: с адресацией по содержимому
+        это один файл, копии для карточек делаются один раз.
+        """
+        buffer = io.BytesIO()
+        Image.radial_gradient('L').convert('RGB').resize((1200, 800)).save(
+            buffer, 'JPEG', quality=85)
+        name = Recipe._meta.get_field('image').storage.save(
+            'recipes/loadtest.jpg', ContentFile(buffer.getvalue()))
+        return name, render_variants(name)
+
+    def create_recipes(self, count, authors, ingredients_range):
+        image, variants = self.recipe_image()
+        author_weights = zipf(authors, self.skew)
+        offset = Recipe.objects.aggregate(Max('id'))['id__max'] or 0
+        recipe_ids = []
+        for numbers in self.batches(count):
+            with transaction.atomic():
+                compositions = [self.composition(*ingredients_range)
+                                for _ in numbers]
+                recipes = Recipe.objects.bulk_create(
+                    Recipe(author_id=author_id,
+                           name=self.recipe_name(composition,
+                                                 offset + number),
+                           text=TEXT.format(
+                               first=self.names[composition[0]],
+                               second=self.names[composition[-1]]),
+                           cooking_time=self.random.randint(5, 180),
+                           image=image, image_variants=variants)
+                    for number, author_id, composition in zip(
+                        numbers, self.random.choices(
+                            authors, cum_weights=author_weights,
+                            k=len(numbers)), compositions))
+                IngredientRecipe.objects.bulk_create(
+                    IngredientRecipe(recipe_id=recipe.id,
+                                     ingredient_id=ingredient_id,
+                                     amount=self.random.randint(1, 500))
+                    for recipe, composition in zip(recipes, compositions)
+                    for ingredient_id in composition)
+                Recipe.tags.through.objects.bulk_create(
+                    Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+                    for recipe in recipes
+                    for tag_id in self.random.sample(
+                        self.tag_ids,
+                        self.random.randint(1, len(self.tag_ids))))
+            recipe_ids.extend(recipe.id for recipe in recipes)
+        return recipe_ids
+
+    def composition(self, minimum, maximum):
+        """Разные ингредиенты рецепта, популярные чаще."""
+        size = min(self.random.randint(minimum, maximum),
+                   len(self.ingredient_ids))
+        chosen = {}
+        while len(chosen) < size:
+            for ingredient_id in self.random.choices(
+                    self.ingredient_ids, cum_weights=self.ingredient_weights,
+                    k=size - len(chosen)):
+                chosen[ingredient_id] = None
+        return list(chosen)
+
+    def recipe_name(self, composition, number):
+        return (f'{self.random.choice(DISHES)}: '
+                f'{self.names[composition[0]]} №{number}')
+
+    def create_pairs(self, model, field, count, user_ids, targets):
+        """
+        Пары пользователь - рецепт или автор: пользователи равномерно,
+        цели по Zipf. Пользователи идут пачками, поэтому повторы
+        отсеиваются в пределах пачки и между пачками не возникают.
+        """
+        weights = zipf(targets, self.skew)
+        created = 0
+        for numbers in self.batches(len(user_ids)):
+            users = user_ids[numbers.start:numbers.stop]
+            size = round(count * len(users) / len(user_ids))
+            pairs = {
+                (user_id, target)
+                for user_id, target in zip(
+                    self.random.choices(users, k=size),
+                    self.random.choices(targets, cum_weights=weights,
+                                        k=size))
+                if user_id != target or field != 'author_id'}
+            model.objects.bulk_create(
+                (model(user_id=user_id, **{field: target})
+                 for user_id, target in sorted(pairs)),
+                ignore_conflicts=True)
+            created += len(pairs)
+        return created
+
+    def finish(self):
+        """Итоги корзин и поиск: bulk_create не вызывает сигналы."""
+        with transaction.atomic():
+            cart_totals.rebuild()
+            update_search_index()
+            transaction.on_commit(invalidate_all)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import generate_variants, variants_outdated
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Уменьшенные копии фото рецептов, у которых их нет или они устарели."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='пересоздать копии всех рецептов')
+
+    def handle(self, *args, **options):
+        done = 0
+        for recipe in Recipe.objects.only(
+                'id', 'image', 'image_variants').iterator():
+            if options['all'] or variants_outdated(recipe):
+                generate_variants(recipe.id, recipe.image.name)
+                done += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Копии фото сделаны для рецептов: {done}'))
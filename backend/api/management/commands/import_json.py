@@ -1,28 +1,140 @@
+import csv
 import json
+import os
+from itertools import islice
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
-from tqdm import tqdm
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
-from api.constants import PATH_TO_JSON
+from api import dictionaries
+from api.cache import invalidate_all
+from api.constants import IMPORT_BATCH_SIZE, PATH_TO_JSON
 from recipes.models import Ingredient
 
+# Сколько символов файла JSON читать за раз.
+READ_SIZE = 64 * 2 ** 10
+INSERT_INGREDIENTS = '''
+    INSERT INTO recipes_ingredient (name, measurement_unit)
+    VALUES {values}
+    ON CONFLICT DO NOTHING
+    RETURNING id
+'''
+
+
+def read_json(file):
+    """Элементы массива JSON по одному, файл читается кусками."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    while True:
+        chunk = file.read(READ_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and (
+                    buffer[position].isspace() or buffer[position] == ','):
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != '[':
+                    raise CommandError('Ожидается массив JSON.')
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                row, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise CommandError('Файл JSON поврежден или оборван.')
+                break
+            yield row['name'], row['measurement_unit']
+            position = end
+        if not chunk:
+            return
+
+
+def read_csv(file):
+    """Строки CSV: название и единица измерения, без заголовка."""
+    for row in csv.reader(file):
+        if row:
+            yield row[0], row[1]
+
+
+READERS = {
+    '.json': read_json,
+    '.csv': read_csv,
+}
+
 
 class Command(BaseCommand):
-    """Скрипт импорта данных из JSON файла ингрединетов."""
-
-    def handle(self, *args, **kwargs):
-        self.import_ingredients()
-
-    def import_ingredients(self):
-        path = settings.BASE_DIR / PATH_TO_JSON
-        with open(
-            path, newline='', encoding='utf-8'
-        ) as fixture:
-            reader = json.load(fixture)
-            for row in tqdm(reader):
-                Ingredient.objects.get_or_create(
-                    name=row['name'],
-                    measurement_unit=row['measurement_unit']
-                )
-        self.stdout.write(self.style.SUCCESS('Данные успешно импортированы'))
+    """
+    Импорт ингредиентов из JSON и CSV файлов пачками в одной
+    транзакции: новые добавляются, у существующих обновляется
+    единица измерения, совпадающие пропускаются.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='*',
+            default=[str(settings.BASE_DIR / PATH_TO_JSON)],
+            help='файлы .json и .csv')
+        parser.add_argument('--batch-size', type=int,
+                            default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        for path in options['paths']:
+            if os.path.splitext(path)[1] not in READERS:
+                raise CommandError(f'Неизвестный формат файла: {path}')
+        self.inserted = self.updated = self.skipped = 0
+        with transaction.atomic():
+            for path in options['paths']:
+                self.import_ingredients(path, options['batch_size'])
+            if self.inserted or self.updated:
+                transaction.on_commit(dictionaries.ingredients.bump_version)
+                transaction.on_commit(invalidate_all)
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные успешно импортированы: добавлено {self.inserted}, '
+            f'обновлено {self.updated}, пропущено {self.skipped}'))
+
+    def import_ingredients(self, path, batch_size):
+        reader = READERS[os.path.splitext(path)[1]]
+        with open(path, newline='', encoding='utf-8') as fixture:
+            rows = reader(fixture)
+            while batch := list(islice(rows, batch_size)):
+                self.import_batch(batch)
+
+    def import_batch(self, batch):
+        """Пачка строк: один запрос на чтение и по одному на запись."""
+        units = {}
+        for name, unit in batch:
+            name, unit = name.strip(), unit.strip()
+            if name in units:
+                self.skipped += 1
+            units[name] = unit
+        existing = Ingredient.objects.filter(
+            name__in=units).only('id', 'name', 'measurement_unit')
+        changed = []
+        for ingredient in existing:
+            unit = units.pop(ingredient.name)
+            if ingredient.measurement_unit == unit:
+                self.skipped += 1
+            else:
+                ingredient.measurement_unit = unit
+                changed.append(ingredient)
+        Ingredient.objects.bulk_update(changed, ['measurement_unit'])
+        self.updated += len(changed)
+        if not units:
+            return
+        # bulk_create при ignore_conflicts не сообщает, что вставлено:
+        # RETURNING отдает только действительно добавленные строки,
+        # добавленные параллельно считаются пропущенными.
+        values = ', '.join(['(%s, %s)'] * len(units))
+        with connection.cursor() as cursor:
+            cursor.execute(INSERT_INGREDIENTS.format(values=values),
+                           [value for row in units.items() for value in row])
+            inserted = len(cursor.fetchall())
+        self.inserted += inserted
+        self.skipped += len(units) - inserted
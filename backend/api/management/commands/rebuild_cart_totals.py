@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes import cart_totals
+
+
+class Command(BaseCommand):
+    """
+    Пересчет итогов корзин с нуля; с --verify только проверка
+    расхождений (ошибка, если они есть).
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='только проверить итоги')
+        parser.add_argument('--user', type=int, nargs='+', dest='user_ids',
+                            help='id пользователей (по умолчанию все)')
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+        if options['verify']:
+            drifted = cart_totals.drift(user_ids)
+            if drifted:
+                raise CommandError(
+                    f'Итоги расходятся с корзиной у {len(drifted)} '
+                    f'пользователей: {sorted(drifted)[:20]}')
+            self.stdout.write(self.style.SUCCESS('Итоги корзин верны'))
+            return
+        with transaction.atomic():
+            rows = cart_totals.rebuild(user_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Итоги корзин пересчитаны, строк: {rows}'))
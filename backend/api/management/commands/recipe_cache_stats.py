@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    """Статистика кэша ответов рецептов для анонимов."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='обнулить счетчики после вывода')
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        requests = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / requests if requests else 0
+        self.stdout.write(
+            f'Попаданий: {stats["hits"]}\n'
+            f'Промахов: {stats["misses"]}\n'
+            f'Доля попаданий: {ratio:.1%}\n'
+            f'Сбросов: {stats["invalidations"]}')
+        if options['reset']:
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS('Счетчики обнулены'))
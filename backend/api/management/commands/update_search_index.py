@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from recipes.search import update_search_index
+
+
+class Command(BaseCommand):
+    """Пересчет поискового индекса всех рецептов."""
+
+    def handle(self, *args, **kwargs):
+        update_search_index()
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс обновлен'))
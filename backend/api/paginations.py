@@ -1,4 +1,4 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 from api.constants import PAGE_QUERY_PARAM, PAGE_SIZE
 
@@ -11,3 +11,14 @@ class ApiPagination(PageNumberPagination):
 
     page_size_query_param = PAGE_QUERY_PARAM
     page_size = PAGE_SIZE
+
+
+class RecipeCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация ленты рецептов по (-pub_date, -id)
+    без COUNT(*) и OFFSET, с limit из запроса.
+    """
+
+    page_size_query_param = PAGE_QUERY_PARAM
+    page_size = PAGE_SIZE
+    ordering = ('-pub_date', '-id')
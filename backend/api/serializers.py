@@ -1,13 +1,53 @@
-from drf_extra_fields.fields import Base64ImageField
+from collections.abc import Mapping
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers, status
 from rest_framework.exceptions import ValidationError
 
 from api.constants import INGREDIENT_AMOUNT
-from recipes.models import (Cart, Favorite, Ingredient, IngredientRecipe,
-                            Recipe, Tag)
+from api.uploads import UploadImageField
+from recipes import cart_totals
+from recipes.images import FORMATS
+from recipes.models import (Cart, CartIngredient, Favorite, Ingredient,
+                            IngredientRecipe, Recipe, Tag)
+from recipes.search import update_search_index
 from user.serializers import UserSerializer
 
 
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Связь по id из объектов, заранее загруженных корневым
+    сериализатором (атрибут preloaded: {модель: {id: объект}}).
+    Id, которых там нет, проверяются обычным запросом - с обычными
+    сообщениями об ошибках.
+    """
+
+    def to_internal_value(self, data):
+        preloaded = getattr(self.root, 'preloaded', {}).get(
+            self.get_queryset().model)
+        if preloaded is not None and not isinstance(data, bool):
+            try:
+                return preloaded[int(data)]
+            except (KeyError, TypeError, ValueError):
+                pass
+        return super().to_internal_value(data)
+
+
+def related_ids(values):
+    """Целые id из сырых данных; остальное отсеет валидация полей."""
+    ids = set()
+    for value in values:
+        if isinstance(value, bool):
+            continue
+        try:
+            ids.add(int(value))
+        except (TypeError, ValueError):
+            pass
+    return ids
+
+
 class TagSerializer(serializers.ModelSerializer):
     """Сериалайзер для тэгов."""
 
@@ -39,10 +79,25 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class CartIngredientSerializer(serializers.ModelSerializer):
+    """Сериалайзер для итогов корзины."""
+
+    id = serializers.ReadOnlyField(
+        source='ingredient.id')
+    name = serializers.ReadOnlyField(
+        source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit')
+
+    class Meta:
+        model = CartIngredient
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
 class IngredientWriteSerializer(serializers.ModelSerializer):
     """Сериалайзер для записи ингредиентов с полем amount."""
 
-    id = serializers.PrimaryKeyRelatedField(
+    id = PreloadedPrimaryKeyRelatedField(
         queryset=Ingredient.objects.all())
     amount = serializers.IntegerField()
 
@@ -64,10 +119,10 @@ class RecipeSerializer(serializers.ModelSerializer):
     ingredients = IngredientWriteSerializer(
         many=True,
         write_only=True)
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = PreloadedPrimaryKeyRelatedField(
         queryset=Tag.objects.all(),
         many=True)
-    image = Base64ImageField(required=True)
+    image = UploadImageField(required=True)
     author = UserSerializer(read_only=True)
 
     class Meta:
@@ -81,6 +136,32 @@ class RecipeSerializer(serializers.ModelSerializer):
                         'name': {'required': True},
                         'text': {'required': True}}
 
+    def to_internal_value(self, data):
+        self.preloaded = self.preload(data)
+        return super().to_internal_value(data)
+
+    def preload(self, data):
+        """
+        Тэги и ингредиенты рецепта одной выборкой на модель: из снимка
+        справочника, если вьюсет передал его в контексте, иначе
+        одним запросом IN.
+        """
+        ingredients = self.fields['ingredients'].get_value(data)
+        tags = self.fields['tags'].get_value(data)
+        ids = {
+            Ingredient: related_ids(
+                ingredient.get('id') for ingredient in ingredients
+                if isinstance(ingredient, Mapping)
+            ) if isinstance(ingredients, list) else set(),
+            Tag: related_ids(tags) if isinstance(tags, list) else set(),
+        }
+        dictionaries = self.context.get('dictionaries', {})
+        return {
+            model: (dictionaries[model].in_bulk(model_ids)
+                    if model in dictionaries
+                    else model.objects.in_bulk(model_ids))
+            for model, model_ids in ids.items()}
+
     def validate(self, attrs):
         """Валидация тэгов, ингредиентов."""
         tags = attrs.get('tags')
@@ -116,19 +197,83 @@ class RecipeSerializer(serializers.ModelSerializer):
         author = self.context.get('request').user
         recipe = Recipe.objects.create(author=author, **validated_data)
         self._add_ingredients(IngredientRecipe, recipe, ingredients, tags)
+        update_search_index([recipe.id])
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
+        """
+        Правка рецепта по разнице с сохраненным составом и тэгами:
+        пишутся только добавленные, измененные и удаленные строки.
+        Кэш сбрасывает сигнал сохранения рецепта, поэтому строки
+        состава и тэгов пишутся без сигналов M2M.
+        """
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        instance.ingredients.clear()
-        instance.tags.clear()
-        self._add_ingredients(IngredientRecipe, instance, ingredients, tags)
-        return super().update(instance, validated_data)
+        reindex = self._update_ingredients(instance, ingredients) or any(
+            field in validated_data
+            and validated_data[field] != getattr(instance, field)
+            for field in ('name', 'text'))
+        self._update_tags(instance, tags)
+        recipe = super().update(instance, validated_data)
+        if reindex:
+            update_search_index([recipe.id])
+        return recipe
 
     def to_representation(self, instance):
+        # После записи префетч сброшен: состав читается одним запросом.
+        prefetch_related_objects([instance], Prefetch(
+            'ingredient_recipe',
+            queryset=IngredientRecipe.objects.select_related('ingredient')))
         return RecipeListSerializer(instance, context=self.context).data
 
+    def _update_ingredients(self, recipe, ingredients):
+        """
+        Состав рецепта по разнице: удаление, bulk_update количеств
+        и bulk_create новых строк; итоги корзин меняются на разницу.
+        Возвращает True, если изменился набор ингредиентов.
+        """
+        # Состав и тэги обычно уже в префетче вьюсета.
+        current = {row.ingredient_id: row
+                   for row in recipe.ingredient_recipe.all()}
+        amounts = {ingredient['id'].id: ingredient['amount']
+                   for ingredient in ingredients}
+        removed = current.keys() - amounts.keys()
+        deltas = {ingredient_id: -current[ingredient_id].amount
+                  for ingredient_id in removed}
+        added = []
+        changed = []
+        for ingredient_id, amount in amounts.items():
+            row = current.get(ingredient_id)
+            if row is None:
+                added.append(IngredientRecipe(
+                    recipe=recipe, ingredient_id=ingredient_id,
+                    amount=amount))
+                deltas[ingredient_id] = amount
+            elif row.amount != amount:
+                deltas[ingredient_id] = amount - row.amount
+                row.amount = amount
+                changed.append(row)
+        if removed:
+            IngredientRecipe.objects.filter(
+                pk__in=[current[ingredient_id].pk
+                        for ingredient_id in removed]).delete()
+        IngredientRecipe.objects.bulk_update(changed, ['amount'])
+        IngredientRecipe.objects.bulk_create(added)
+        cart_totals.apply_delta(recipe.id, deltas)
+        return bool(removed or added)
+
+    def _update_tags(self, recipe, tags):
+        """Тэги рецепта по разнице с сохраненными."""
+        through = Recipe.tags.through
+        current = {tag.id for tag in recipe.tags.all()}
+        new = {tag.id for tag in tags}
+        if current - new:
+            through.objects.filter(
+                recipe=recipe, tag_id__in=current - new).delete()
+        through.objects.bulk_create(
+            through(recipe=recipe, tag_id=tag_id) for tag_id in new - current)
+
     def _add_ingredients(self, model, recipe, ingredients, tags):
         model.objects.bulk_create(
             model(
@@ -153,19 +298,47 @@ class RecipeListSerializer(serializers.ModelSerializer):
         read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
+                  'name', 'image', 'image_variants', 'text', 'cooking_time')
+
+    def get_image_variants(self, obj):
+        """
+        Адреса уменьшенных копий фото, их размеры и заглушка;
+        пустой словарь, пока копии не готовы.
+        """
+        variants = obj.image_variants
+        if variants.get('source') != obj.image.name:
+            return {}
+        request = self.context.get('request')
+
+        def url(name):
+            url = default_storage.url(name)
+            return request.build_absolute_uri(url) if request else url
+
+        return {
+            'width': variants['width'],
+            'height': variants['height'],
+            'placeholder': variants['placeholder'],
+            **{label: {key: url(value) if key in FORMATS else value
+                       for key, value in size.items()}
+               for label, size in variants['sizes'].items()},
+        }
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         return user.is_authenticated and user.favorites.filter(
             recipe_id=obj.id).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         return user.is_authenticated and user.carts.filter(
             recipe_id=obj.id).exists()
@@ -189,13 +362,6 @@ class CartFavoriteSerializer(serializers.ModelSerializer):
         fields = ('user', 'recipe')
         read_only_fields = ('user',)
 
-    def validate(self, attrs):
-        recipe = attrs['recipe']
-        user = self.context['request'].user
-        if self.Meta.model.objects.filter(recipe=recipe, user=user).exists():
-            raise serializers.ValidationError('рецепт уже добавлен.')
-        return super().validate(attrs)
-
     def to_representation(self, instance):
         return RecipeFollowSerializer(
             instance.recipe,
@@ -0,0 +1,129 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from api import dictionaries
+from api.cache import invalidate_all, invalidate_recipes
+from recipes import cart_totals
+from recipes.images import schedule_variants, variants_outdated
+from recipes.models import Cart, Ingredient, IngredientRecipe, Recipe, Tag
+from recipes.search import update_search_index
+from shortlink.cache import forget
+from shortlink.models import ShortLink
+from user.models import User
+
+# Поля пользователя, которые попадают в карточку автора рецепта.
+PROFILE_FIELDS = frozenset(
+    ('email', 'username', 'first_name', 'last_name', 'avatar'))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    """Изменение/удаление рецепта."""
+    transaction.on_commit(partial(invalidate_recipes, instance.pk))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_changed(sender, instance, **kwargs):
+    """Копии нового фото рецепта."""
+    if variants_outdated(instance):
+        schedule_variants(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    """Удаление рецепта из поискового индекса."""
+    update_search_index([instance.pk])
+
+
+@receiver(post_save, sender=Cart)
+def cart_added(sender, instance, created, **kwargs):
+    """Рецепт в корзине: его состав прибавляется к итогам корзины."""
+    if created:
+        cart_totals.add_to_cart(instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_delete, sender=Cart)
+def cart_removed(sender, instance, **kwargs):
+    """
+    Рецепт убирается из корзины (в том числе при удалении рецепта,
+    пока его состав еще в базе): состав вычитается из итогов.
+    """
+    cart_totals.remove_from_cart(instance.user_id, instance.recipe_id)
+
+
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    """Изменение состава рецепта."""
+    transaction.on_commit(partial(invalidate_recipes, instance.recipe_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_relations_changed(sender, instance, action, reverse, **kwargs):
+    """Изменение тэгов или ингредиентов рецепта через M2M."""
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        transaction.on_commit(invalidate_all)
+    else:
+        transaction.on_commit(partial(invalidate_recipes, instance.pk))
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, update_fields=None, **kwargs):
+    """Изменение профиля автора в карточках его рецептов."""
+    if update_fields is not None and not PROFILE_FIELDS & set(update_fields):
+        return
+    recipe_ids = list(instance.recipes.values_list('id', flat=True))
+    if recipe_ids:
+        transaction.on_commit(partial(invalidate_recipes, *recipe_ids))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(sender, **kwargs):
+    """Изменение справочника тэгов."""
+    transaction.on_commit(dictionaries.tags.bump_version)
+    transaction.on_commit(invalidate_all)
+
+
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_deleting(sender, instance, **kwargs):
+    """
+    Рецепты с ингредиентом запоминаются до удаления: к post_delete
+    строки состава уже удалены каскадом.
+    """
+    instance.deleted_recipe_ids = list(IngredientRecipe.objects.filter(
+        ingredient=instance).values_list('recipe_id', flat=True))
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, instance, created=False, **kwargs):
+    """Изменение справочника ингредиентов."""
+    recipe_ids = getattr(instance, 'deleted_recipe_ids', None)
+    if recipe_ids is None and not created:
+        recipe_ids = IngredientRecipe.objects.filter(
+            ingredient=instance).values_list('recipe_id', flat=True)
+    if recipe_ids is not None:
+        update_search_index(recipe_ids)
+    transaction.on_commit(dictionaries.ingredients.bump_version)
+    transaction.on_commit(invalidate_all)
+
+
+@receiver(pre_save, sender=ShortLink)
+def short_link_saving(sender, instance, **kwargs):
+    """Прежний код ссылки: после смены кода сбрасывается именно он."""
+    if instance.pk is not None:
+        instance.previous_short = ShortLink.objects.filter(
+            pk=instance.pk).values_list('short', flat=True).first()
+
+
+@receiver((post_save, post_delete), sender=ShortLink)
+def short_link_changed(sender, instance, **kwargs):
+    """Изменение короткой ссылки в админке."""
+    for code in {instance.short, getattr(instance, 'previous_short', None)}:
+        if code is not None:
+            transaction.on_commit(partial(forget, code))
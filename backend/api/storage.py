@@ -0,0 +1,46 @@
+"""
+Хранилище загрузок с именами по содержимому.
+
+Файл называется sha256 своих байт, поэтому одинаковые загрузки
+(например, то же фото при каждом редактировании рецепта) хранятся
+один раз, а содержимое по имени никогда не меняется и кэшируется
+навсегда. Файлы не удаляются вместе со строками - их могут делить
+несколько записей; лишние убирает команда collect_media.
+"""
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище MEDIA_ROOT с именами файлов по sha256."""
+
+    def hashed_name(self, name, content):
+        """Имя в том же каталоге: хэш содержимого и расширение."""
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(directory, digest.hexdigest() + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            # Свежая дата изменения: сборщик не удалит файл, который
+            # снова понадобился, пока строка с ним не записана.
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
+
+
+content_storage = ContentAddressedStorage()
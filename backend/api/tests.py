@@ -1,13 +1,1485 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
+from io import BytesIO, StringIO
+from itertools import count
+from unittest.mock import patch
 
-from django.test import Client, TestCase
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import (Client, RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.test import APIClient
 
+from api import dictionaries
+from api import urls as api_urls
+from api.cache import get_stats
+from api.constants import AUTOCOMPLETE_LIMIT, S_LINK_LENGTH
+from recipes import cart_totals
+from recipes.images import generate_variants
+from recipes.models import (Cart, CartIngredient, Favorite, Ingredient,
+                            IngredientRecipe, Recipe, Tag)
+from recipes.search import FTS_TABLE, update_search_index
+from shortlink import urls as shortlink_urls
+from shortlink.cache import local_links
+from shortlink.codes import short_code
+from shortlink.models import ShortLink
+from user.models import Follow, User
 
+
+# Картинка 1x1 для записи рецептов через API.
+IMAGE = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1Pe'
+         'AAAADElEQVR4nGNgYGAAAAAEAAH2FzhVAAAAAElFTkSuQmCC')
+
+# Тесты работают с кэшем в памяти: общий файловый кэш по умолчанию
+# остается нетронутым, параллельные прогоны не сбрасывают кэш друг друга.
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'foodgram-tests',
+    }
+}
+
+
+class TempMediaMixin:
+    """Медиафайлы класса тестов пишутся во временный каталог."""
+
+    @classmethod
+    def setUpClass(cls):
+        media = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=media)
+        media_settings.enable()
+        cls.addClassCleanup(media_settings.disable)
+        super().setUpClass()
+
+
+def image_file(size=(1, 1)):
+    """Загруженный PNG заданного размера."""
+    buffer = BytesIO()
+    Image.new('RGB', size, 'orange').save(buffer, 'PNG')
+    return SimpleUploadedFile('recipe.png', buffer.getvalue(),
+                              content_type='image/png')
+
+
+# Потоков в тестах гонок.
+THREADS = 8
+
+
+@override_settings(CACHES=TEST_CACHES)
 class TaskiAPITestCase(TestCase):
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
 
     def test_list_exists(self):
         """Проверка доступности списка рецептов."""
         response = self.guest_client.get('/api/recipes/')
         self.assertEqual(response.status_code, HTTPStatus.OK)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeFlagsTestCase(TestCase):
+    """Флаги избранного и корзины в списке рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@foodgram.ru', username='user', password='pass')
+        cls.author = User.objects.create_user(
+            email='author@foodgram.ru', username='author', password='pass')
+        cls.favorite = Recipe.objects.create(
+            author=cls.author, name='Избранный', text='текст',
+            image='recipes/favorite.png')
+        cls.other = Recipe.objects.create(
+            author=cls.author, name='Другой', text='текст',
+            image='recipes/other.png')
+        Favorite.objects.create(user=cls.user, recipe=cls.favorite)
+        Cart.objects.create(user=cls.user, recipe=cls.other)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_flags_in_list(self):
+        """Флаги берутся из аннотаций кверисета."""
+        response = self.client.get('/api/recipes/')
+        flags = {recipe['id']: (recipe['is_favorited'],
+                                recipe['is_in_shopping_cart'])
+                 for recipe in response.json()['results']}
+        self.assertEqual(flags, {self.favorite.id: (True, False),
+                                 self.other.id: (False, True)})
+
+    def test_flag_filters(self):
+        """Фильтры по флагам используют те же аннотации."""
+        for query, recipe in (('is_favorited=1', self.favorite),
+                              ('is_in_shopping_cart=1', self.other)):
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/recipes/?{query}')
+                ids = [item['id'] for item in response.json()['results']]
+                self.assertEqual(ids, [recipe.id])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SubscribedFlagTestCase(TestCase):
+    """Флаг подписки на авторов во вложенных сериализаторах."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@foodgram.ru', username='user', password='pass')
+        cls.followed = User.objects.create_user(
+            email='followed@foodgram.ru', username='followed',
+            password='pass')
+        cls.other = User.objects.create_user(
+            email='other@foodgram.ru', username='other', password='pass')
+        Follow.objects.create(user=cls.user, author=cls.followed)
+        for author in (cls.followed, cls.other):
+            for number in range(3):
+                Recipe.objects.create(
+                    author=author, name=f'Рецепт {number}', text='текст',
+                    image='recipes/recipe.png')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_users_list(self):
+        """Подписки в списке пользователей."""
+        response = self.client.get('/api/users/')
+        flags = {user['id']: user['is_subscribed']
+                 for user in response.json()['results']}
+        self.assertEqual(flags, {self.user.id: False,
+                                 self.followed.id: True,
+                                 self.other.id: False})
+
+    def test_recipe_authors(self):
+        """Подписки авторов рецептов в ленте."""
+        response = self.client.get('/api/recipes/')
+        for recipe in response.json()['results']:
+            author = recipe['author']
+            self.assertEqual(author['is_subscribed'],
+                             author['id'] == self.followed.id)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class UserUpdateTestCase(TestCase):
+    """Изменение профиля по /api/users/{id}/."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@foodgram.ru', username='user', password='pass',
+            first_name='Имя')
+        cls.other = User.objects.create_user(
+            email='other@foodgram.ru', username='other', password='pass')
+
+    def test_only_owner(self):
+        """Аноним и другой пользователь не могут менять чужой профиль."""
+        url = f'/api/users/{self.user.id}/'
+        client = APIClient()
+        for user, status in ((None, HTTPStatus.UNAUTHORIZED),
+                             (self.other, HTTPStatus.FORBIDDEN),
+                             (self.user, HTTPStatus.OK)):
+            client.force_authenticate(user)
+            for method in ('put', 'patch'):
+                with self.subTest(user=user, method=method):
+                    response = getattr(client, method)(url, {
+                        'email': 'user@foodgram.ru', 'username': 'user',
+                        'first_name': f'{user}', 'last_name': 'Фамилия'},
+                        format='json')
+                    self.assertEqual(response.status_code, status)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'user')
+        self.assertEqual(client.get(url).status_code, HTTPStatus.OK)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SubscriptionsTestCase(TestCase):
+    """Страница подписок: рецепты авторов и число запросов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@foodgram.ru', username='user', password='pass')
+        cls.authors = []
+        for number in range(5):
+            author = User.objects.create_user(
+                email=f'author{number}@foodgram.ru',
+                username=f'author{number}', password='pass')
+            Follow.objects.create(user=cls.user, author=author)
+            for recipe_number in range(number):
+                Recipe.objects.create(
+                    author=author, name=f'Рецепт {recipe_number}',
+                    text='текст', image='recipes/recipe.png')
+            cls.authors.append(author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_recipes_limit(self):
+        """Первые recipes_limit рецептов автора и их общее число."""
+        response = self.client.get(
+            '/api/users/subscriptions/?recipes_limit=2')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        for author, card in zip(self.authors, response.json()['results']):
+            newest = list(author.recipes.values_list('id', flat=True)[:2])
+            self.assertEqual(card['id'], author.id)
+            self.assertTrue(card['is_subscribed'])
+            self.assertEqual(card['recipes_count'], author.recipes.count())
+            self.assertEqual([recipe['id'] for recipe in card['recipes']],
+                             newest)
+
+    def test_constant_queries(self):
+        """Число запросов не растет с размером страницы."""
+        for limit in (1, 5):
+            with self.subTest(limit=limit), self.assertNumQueries(3):
+                response = self.client.get(
+                    f'/api/users/subscriptions/?limit={limit}'
+                    '&recipes_limit=3')
+                self.assertEqual(len(response.json()['results']), limit)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeQueryCountTestCase(TestCase):
+    """Количество запросов списка и страницы рецепта."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@foodgram.ru', username='user', password='pass')
+        tags = [Tag.objects.create(name=f'Тэг {number}', slug=f'tag{number}')
+                for number in range(2)]
+        ingredients = [Ingredient.objects.create(
+            name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(5)]
+        for number in range(6):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=f'Рецепт {number}', text='текст',
+                image='recipes/recipe.png')
+            recipe.tags.set(tags)
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                                 amount=number + 1)
+                for ingredient in ingredients)
+        cls.recipe = recipe
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_list(self):
+        """Список: count, рецепты, состав и тэги."""
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(len(response.json()['results'][0]['ingredients']),
+                         5)
+
+    def test_detail(self):
+        """Страница рецепта: рецепт, состав и тэги."""
+        with self.assertNumQueries(3):
+            self.client.get(f'/api/recipes/{self.recipe.id}/')
+
+    def test_list_authenticated(self):
+        """Для пользователя добавляется только запрос подписок."""
+        self.client.force_authenticate(self.user)
+        with self.assertNumQueries(5):
+            self.client.get('/api/recipes/')
+
+    def test_cursor_pagination(self):
+        """Курсорная лента без COUNT(*) проходит все рецепты по порядку."""
+        url = '/api/recipes/?pagination=cursor&limit=4&tags=tag0'
+        # Тэги фильтра, рецепты, состав и тэги рецептов.
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        ids = []
+        while url:
+            page = self.client.get(url).json()
+            ids += [recipe['id'] for recipe in page['results']]
+            url = page['next']
+        self.assertEqual(ids, list(Recipe.objects.values_list(
+            'id', flat=True)))
+        self.assertEqual(len(response.json()['results']), 4)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeCacheTestCase(TempMediaMixin, TestCase):
+    """Кэш ответов рецептов для анонимов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@foodgram.ru', username='author', password='pass')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='текст',
+            image=image_file())
+        # Копии фото готовы, правка рецепта их не пересоздает.
+        generate_variants(cls.recipe.id, cls.recipe.image.name)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = f'/api/recipes/{self.recipe.id}/'
+
+    def test_hit_without_queries(self):
+        """Повторный запрос с теми же параметрами не идет в БД."""
+        author = self.author.id
+        self.client.get(f'/api/recipes/?limit=2&author={author}&page=1')
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                f'/api/recipes/?page=1&author={author}&limit=2')
+        self.assertEqual(response.json()['count'], 1)
+        self.assertEqual(get_stats()['hits'], 1)
+
+    def test_authenticated_bypass(self):
+        """Ответы пользователям не кэшируются."""
+        self.client.get(self.url)
+        self.client.force_authenticate(self.author)
+        with self.assertNumQueries(4):
+            self.client.get(self.url)
+
+    def test_recipe_change(self):
+        """Правка рецепта сбрасывает его страницу и ленту."""
+        self.client.get(self.url)
+        self.client.get('/api/recipes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.get(id=self.recipe.id).save()
+        self.assertEqual(self.client.get(self.url).json()['name'], 'Рецепт')
+        self.client.get('/api/recipes/')
+        self.assertEqual(get_stats(), {'hits': 0, 'misses': 4,
+                                       'invalidations': 1})
+
+    def test_author_change(self):
+        """Правка профиля автора сбрасывает его рецепты, вход - нет."""
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.save(update_fields=['last_login'])
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = 'Автор'
+            self.author.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()['author']['first_name'], 'Автор')
+        self.assertEqual(get_stats(), {'hits': 1, 'misses': 2,
+                                       'invalidations': 1})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class DictionarySnapshotTestCase(TestCase):
+    """Снимки справочников тэгов и ингредиентов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name='Завтрак', slug='breakfast')
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def test_not_modified(self):
+        """Повторный запрос с ETag получает 304 без обращения к БД."""
+        for url in ('/api/tags/', '/api/ingredients/'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(len(response.json()), 1)
+                with self.assertNumQueries(0):
+                    response = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.NOT_MODIFIED)
+
+    def test_gzip(self):
+        """Сжатый снимок отдается клиентам с gzip."""
+        response = self.client.get('/api/ingredients/',
+                                   HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        data = json.loads(gzip.decompress(response.content))
+        self.assertEqual(data[0]['name'], 'соль')
+
+    def test_etag_per_encoding(self):
+        """У gzip и несжатого ответа разные ETag; Vary по кодировке."""
+        plain = self.client.get('/api/tags/')
+        gzipped = self.client.get('/api/tags/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotEqual(plain['ETag'], gzipped['ETag'])
+        self.assertIn('Accept-Encoding', gzipped['Vary'])
+        response = self.client.get('/api/tags/',
+                                   HTTP_IF_NONE_MATCH=gzipped['ETag'])
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_if_none_match_list(self):
+        """If-None-Match разбирается как список, с W/ и *."""
+        etag = self.client.get('/api/tags/')['ETag']
+        cases = {
+            f'"other", W/{etag}': HTTPStatus.NOT_MODIFIED,
+            '*': HTTPStatus.NOT_MODIFIED,
+            etag[:-2] + '"': HTTPStatus.OK,
+            f'"x{etag[1:]}': HTTPStatus.OK,
+        }
+        for header, status in cases.items():
+            with self.subTest(header=header):
+                response = self.client.get('/api/tags/',
+                                           HTTP_IF_NONE_MATCH=header)
+                self.assertEqual(response.status_code, status)
+
+    def test_version_bump(self):
+        """Запись в справочник меняет версию и ETag."""
+        etag = self.client.get('/api/tags/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Обед', slug='lunch')
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(len(response.json()), 2)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class IngredientAutocompleteTestCase(TestCase):
+    """Автодополнение ингредиентов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('сметана 20%', 'сметана', 'соль морская', 'соль',
+                     'сванская соль', 'молоко', 'фасоль'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def search(self, query):
+        response = self.client.get('/api/ingredients/', {'name': query})
+        return [ingredient['name'] for ingredient in response.json()]
+
+    def test_ranking(self):
+        """Точное совпадение, префикс, слово, вхождение."""
+        self.assertEqual(self.search('Соль'), [
+            'соль', 'соль морская', 'сванская соль', 'фасоль'])
+
+    def test_typos(self):
+        """Опечатки в словах запроса."""
+        self.assertEqual(self.search('смитана'), ['сметана', 'сметана 20%'])
+        self.assertEqual(self.search('малоко'), ['молоко'])
+
+    def test_limit(self):
+        """Выдача ограничена."""
+        for number in range(AUTOCOMPLETE_LIMIT):
+            Ingredient.objects.create(name=f'сахар {number}',
+                                      measurement_unit='г')
+        self.assertEqual(len(self.search('сахар')), AUTOCOMPLETE_LIMIT)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeSearchTestCase(TestCase):
+    """Полнотекстовый поиск рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@foodgram.ru', username='author', password='pass')
+        beet = Ingredient.objects.create(name='свекла', measurement_unit='г')
+        cls.borscht = Recipe.objects.create(
+            author=author, name='Борщ', text='Суп со сметаной.',
+            image='recipes/borscht.png')
+        IngredientRecipe.objects.create(recipe=cls.borscht, ingredient=beet)
+        cls.bread = Recipe.objects.create(
+            author=author, name='Хлеб', text='Подается к борщу.',
+            image='recipes/bread.png')
+        update_search_index()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def search(self, query):
+        response = self.client.get('/api/recipes/', {'search': query})
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_ingredient(self):
+        """Поиск по названию ингредиента."""
+        self.assertEqual(self.search('свекла'), [self.borscht.id])
+
+    def test_ingredient_deleted(self):
+        """Удаленный ингредиент пропадает из поиска по рецептам."""
+        Ingredient.objects.filter(name='свекла').delete()
+        self.assertEqual(self.search('свекла'), [])
+
+    def test_rank(self):
+        """Совпадение в названии выше совпадения в описании."""
+        self.assertEqual(self.search('борщ'),
+                         [self.borscht.id, self.bread.id])
+
+    def test_cursor_rejected(self):
+        """Поиск с курсорной пагинацией отклоняется."""
+        response = self.client.get('/api/recipes/', {
+            'search': 'борщ', 'pagination': 'cursor'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertIn('search', response.json())
+
+    def test_with_filters(self):
+        """Поиск работает вместе с фильтрами."""
+        response = self.client.get('/api/recipes/', {
+            'search': 'борщ', 'author': self.borscht.author_id, 'limit': 1})
+        self.assertEqual(response.json()['count'], 2)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ShoppingCartDownloadTestCase(TestCase):
+    """Выгрузка списка покупок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@foodgram.ru', username='user', password='pass')
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        milk = Ingredient.objects.create(name='молоко', measurement_unit='мл')
+        compositions = (((salt, 5), (milk, 200)), ((salt, 10),), ())
+        for number, amounts in enumerate(compositions):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=f'Рецепт {number}', text='текст',
+                image='recipes/recipe.png')
+            for ingredient, amount in amounts:
+                IngredientRecipe.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=amount)
+            Cart.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self, file_format=None):
+        url = '/api/recipes/download_shopping_cart/'
+        if file_format:
+            url += f'?file_format={file_format}'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return b''.join(response.streaming_content)
+
+    def test_totals(self):
+        """Суммы по ингредиентам без строк от рецептов без состава."""
+        self.assertEqual(self.download().decode().splitlines()[1:],
+                         ['молоко - 200 мл.', 'соль - 15 г.'])
+
+    def test_formats(self):
+        """CSV с BOM, PDF и отказ на неизвестный формат."""
+        rows = self.download('csv').decode('utf-8-sig').splitlines()
+        self.assertEqual(rows[1:], ['молоко,200,мл', 'соль,15,г'])
+        self.assertTrue(self.download('pdf').startswith(b'%PDF'))
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?file_format=doc')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_cached_until_cart_changes(self):
+        """Неизмененная корзина отдается из кэша без агрегации."""
+        self.download()
+        with self.assertNumQueries(1):
+            self.download()
+        recipe = Recipe.objects.get(name='Рецепт 1')
+        response = self.client.delete(
+            f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        self.assertIn('соль - 5 г.', self.download().decode())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CartTotalsTestCase(TempMediaMixin, TestCase):
+    """Итоги корзин при изменении корзины и состава рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@foodgram.ru', username='user', password='pass')
+        cls.other = User.objects.create_user(
+            email='other@foodgram.ru', username='other', password='pass')
+        cls.salt = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        cls.milk = Ingredient.objects.create(
+            name='молоко', measurement_unit='мл')
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.recipes = []
+        for number, amount in enumerate((5, 10)):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=f'Рецепт {number}', text='текст',
+                image='recipes/recipe.png', cooking_time=1)
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=cls.salt, amount=amount)
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def summary(self):
+        response = self.client.get('/api/recipes/shopping_cart_summary/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return {item['name']: item['amount'] for item in response.json()}
+
+    def add(self, recipe):
+        response = self.client.post(
+            f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+
+    def test_add_remove(self):
+        """Добавление и удаление рецептов из корзины."""
+        for recipe in self.recipes:
+            self.add(recipe)
+        self.assertEqual(self.summary(), {'соль': 15})
+        self.client.delete(f'/api/recipes/{self.recipes[0].id}/shopping_cart/')
+        self.assertEqual(self.summary(), {'соль': 10})
+        self.client.delete(f'/api/recipes/{self.recipes[1].id}/shopping_cart/')
+        self.assertEqual(self.summary(), {})
+
+    def test_repeat_and_missing(self):
+        """Повтор - 400 без изменения итогов, нет рецепта - 404."""
+        recipe_id = self.recipes[0].id
+        for action in ('favorite', 'shopping_cart'):
+            with self.subTest(action=action):
+                url = f'/api/recipes/{recipe_id}/{action}/'
+                self.assertEqual(self.client.post(url).status_code,
+                                 HTTPStatus.CREATED)
+                response = self.client.post(url)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.BAD_REQUEST)
+                self.assertEqual(response.json(), {
+                    'non_field_errors': ['рецепт уже добавлен.']})
+                self.assertEqual(self.client.delete(url).status_code,
+                                 HTTPStatus.NO_CONTENT)
+                self.assertEqual(self.client.delete(url).status_code,
+                                 HTTPStatus.BAD_REQUEST)
+                for method in ('post', 'delete'):
+                    response = getattr(self.client, method)(
+                        f'/api/recipes/999/{action}/')
+                    self.assertEqual(response.status_code,
+                                     HTTPStatus.NOT_FOUND)
+        self.add(self.recipes[0])
+        self.client.post(f'/api/recipes/{recipe_id}/shopping_cart/')
+        self.assertEqual(self.summary(), {'соль': 5})
+        self.assertEqual(cart_totals.drift(), set())
+
+    def test_recipe_edit(self):
+        """Правка состава меняет итоги всех корзин с рецептом."""
+        self.add(self.recipes[0])
+        self.add(self.recipes[1])
+        Cart.objects.create(user=self.other, recipe=self.recipes[0])
+        response = self.client.patch(
+            f'/api/recipes/{self.recipes[0].id}/', {
+                'ingredients': [{'id': self.milk.id, 'amount': 200}],
+                'tags': [self.tag.id],
+                'image': IMAGE,
+                'name': 'Рецепт 0', 'text': 'текст', 'cooking_time': 1},
+            format='json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(self.summary(), {'молоко': 200, 'соль': 10})
+        self.assertEqual(cart_totals.drift(), set())
+
+    def test_recipe_diff(self):
+        """Правка пишет только разницу состава и тэгов."""
+        recipe = self.recipes[0]
+        row = recipe.ingredient_recipe.get()
+        self.add(recipe)
+        data = {'ingredients': [{'id': self.salt.id, 'amount': 7},
+                                {'id': self.milk.id, 'amount': 100}],
+                'tags': [self.tag.id], 'image': IMAGE,
+                'name': 'Рецепт 0', 'text': 'текст', 'cooking_time': 1}
+        response = self.client.put(f'/api/recipes/{recipe.id}/', data,
+                                   format='json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(recipe.ingredient_recipe.get(
+            ingredient=self.salt).id, row.id)
+        self.assertEqual(self.summary(), {'молоко': 100, 'соль': 7})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.put(f'/api/recipes/{recipe.id}/', data,
+                            format='json')
+        written = [query['sql'] for query in queries
+                   if re.match(r'(INSERT|UPDATE|DELETE)', query['sql'])
+                   and re.search(r'ingredientrecipe|recipe_tags|'
+                                 r'cartingredient|_fts', query['sql'])]
+        self.assertEqual(written, [])
+        self.assertEqual(cart_totals.drift(), set())
+
+    def test_recipe_diffing(self):
+        """Правка состава в обход API меняет итоги на разницу."""
+        recipe = self.recipes[0]
+        self.add(recipe)
+        Cart.objects.create(user=self.other, recipe=recipe)
+        with cart_totals.recipe_diffing(recipe.id):
+            recipe.ingredient_recipe.update(amount=8)
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=self.milk, amount=50)
+        self.assertEqual(self.summary(), {'молоко': 50, 'соль': 8})
+        self.assertEqual(cart_totals.drift(), set())
+
+    def test_recipe_delete(self):
+        """Удаление рецепта убирает его состав из корзин."""
+        self.add(self.recipes[0])
+        self.add(self.recipes[1])
+        self.recipes[0].delete()
+        self.assertEqual(self.summary(), {'соль': 10})
+
+    def test_rebuild(self):
+        """Команда находит и исправляет расхождения."""
+        self.add(self.recipes[0])
+        CartIngredient.objects.update(amount=1)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_cart_totals', '--verify', stdout=StringIO())
+        call_command('rebuild_cart_totals', stdout=StringIO())
+        self.assertEqual(self.summary(), {'соль': 5})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeWriteValidationTestCase(TempMediaMixin, TestCase):
+    """Проверка id тэгов и ингредиентов при записи рецепта."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@foodgram.ru', username='user', password='pass')
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(20))
+
+    def setUp(self):
+        cache.clear()
+        self.numbers = count()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create(self, ingredient_ids, tag_ids):
+        return self.client.post('/api/recipes/', {
+            'ingredients': [{'id': ingredient_id, 'amount': 1}
+                            for ingredient_id in ingredient_ids],
+            'tags': tag_ids, 'image': IMAGE,
+            'name': f'Рецепт {next(self.numbers)}',
+            'text': 'текст', 'cooking_time': 1}, format='json')
+
+    def test_missing_ids(self):
+        """Сообщения о несуществующих id прежние."""
+        message = PrimaryKeyRelatedField.default_error_messages[
+            'does_not_exist'].format(pk_value=999)
+        response = self.create([self.ingredients[0].id, 999], [999])
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertEqual(response.json(), {
+            'ingredients': [{}, {'id': [message]}], 'tags': [message]})
+
+    def test_flat_queries(self):
+        """Число запросов не зависит от числа ингредиентов."""
+        self.create([self.ingredients[0].id], [self.tag.id])
+        counts = []
+        for size in (1, 20):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.create(
+                    [ingredient.id for ingredient in self.ingredients[:size]],
+                    [self.tag.id])
+            self.assertEqual(response.status_code, HTTPStatus.CREATED)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_ingredient_after_snapshot(self):
+        """Ингредиент, которого еще нет в снимке, находится запросом."""
+        dictionaries.ingredients.get_snapshot()
+        ingredient = Ingredient.objects.create(
+            name='новый', measurement_unit='г')
+        response = self.create([ingredient.id], [self.tag.id])
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ShortCodeTestCase(TestCase):
+    """Коды коротких ссылок и переадресация по ним."""
+
+    def setUp(self):
+        cache.clear()
+        local_links.clear()
+
+    def test_unique(self):
+        """Разные рецепты получают разные коды минимальной длины."""
+        codes = {short_code(recipe_id, lambda code: False)
+                 for recipe_id in range(1, 5001)}
+        self.assertEqual(len(codes), 5000)
+        self.assertEqual({len(code) for code in codes}, {S_LINK_LENGTH})
+
+    def test_length_grows(self):
+        """Длина растет для больших id и занятых кодов."""
+        self.assertEqual(
+            len(short_code(62 ** S_LINK_LENGTH, lambda code: False)),
+            S_LINK_LENGTH + 1)
+        code = short_code(1, lambda code: len(code) == S_LINK_LENGTH)
+        self.assertEqual(len(code), S_LINK_LENGTH + 1)
+
+    def test_get_link(self):
+        """Ссылка создается одной вставкой, затем читается одним запросом."""
+        user = User.objects.create_user(
+            email='user@foodgram.ru', username='user', password='pass')
+        recipe = Recipe.objects.create(
+            author=user, name='Рецепт', text='текст',
+            image='recipes/recipe.png', cooking_time=1)
+        url = f'/api/recipes/{recipe.id}/get-link/'
+        links = set()
+        for queries in (2, 1):
+            with self.assertNumQueries(queries):
+                response = self.client.get(url, HTTP_HOST='foodgram.ru')
+            links.add(response.json()['short-link'])
+        self.assertEqual(links, {
+            f'http://foodgram.ru/s/{short_code(recipe.id, lambda code: 0)}/'})
+        response = self.client.get(f'/api/recipes/{recipe.id + 1}/get-link/')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        self.assertEqual(ShortLink.objects.count(), 1)
+
+    def test_legacy_code_taken(self):
+        """Код, занятый прежней ссылкой, заменяется более длинным."""
+        user = User.objects.create_user(
+            email='user@foodgram.ru', username='user', password='pass')
+        recipe = Recipe.objects.create(
+            author=user, name='Рецепт', text='текст',
+            image='recipes/recipe.png', cooking_time=1)
+        ShortLink.objects.create(
+            full='/old/', short=short_code(recipe.id, lambda code: False))
+        code = ShortLink.objects.for_recipe(recipe.id)
+        self.assertEqual(len(code), S_LINK_LENGTH + 1)
+
+    def test_code_changed(self):
+        """После смены кода в админке прежний код больше не работает."""
+        link = ShortLink.objects.create(full='/recipes/1/', short='abc')
+        self.client.get('/s/abc/')
+        link.short = 'xyz'
+        with self.captureOnCommitCallbacks(execute=True):
+            link.save()
+        self.assertEqual(self.client.get('/s/abc/').status_code,
+                         HTTPStatus.NOT_FOUND)
+        self.assertEqual(self.client.get('/s/xyz/')['Location'],
+                         '/recipes/1/')
+
+    def test_create_short_links(self):
+        """Команда создает ссылки недостающим рецептам и считает их."""
+        user = User.objects.create_user(
+            email='user@foodgram.ru', username='user', password='pass')
+        recipes = [Recipe.objects.create(
+            author=user, name=f'Рецепт {number}', text='текст',
+            image='recipes/recipe.png', cooking_time=1)
+            for number in range(3)]
+        ShortLink.objects.for_recipe(recipes[0].id)
+        for created in (2, 0):
+            out = StringIO()
+            call_command('create_short_links', stdout=out)
+            self.assertIn(f'Создано коротких ссылок: {created}',
+                          out.getvalue())
+        self.assertEqual(ShortLink.objects.count(), 3)
+
+    def test_create_short_links_parallel(self):
+        """Ссылка, созданная параллельно, не считается созданной."""
+        user = User.objects.create_user(
+            email='user@foodgram.ru', username='user', password='pass')
+        recipes = [Recipe.objects.create(
+            author=user, name=f'Рецепт {number}', text='текст',
+            image='recipes/recipe.png', cooking_time=1)
+            for number in range(2)]
+        inserted = []
+
+        def parallel_insert(execute, sql, params, many, context):
+            if sql.lstrip().startswith('INSERT') and not inserted:
+                inserted.append(sql)
+                ShortLink.objects.for_recipe(recipes[0].id)
+            return execute(sql, params, many, context)
+
+        out = StringIO()
+        with connection.execute_wrapper(parallel_insert):
+            call_command('create_short_links', stdout=out)
+        self.assertIn('Создано коротких ссылок: 1', out.getvalue())
+        self.assertEqual(ShortLink.objects.count(), 2)
+
+    def test_redirect(self):
+        """Переадресация с любого хоста, из кэша и 404 для неизвестных."""
+        ShortLink.objects.create(full='/recipes/1/', short='abc')
+        for host in ('foodgram.ru', 'www.foodgram.ru'):
+            response = self.client.get('/s/abc/', HTTP_HOST=host)
+            self.assertEqual(response.status_code,
+                             HTTPStatus.MOVED_PERMANENTLY)
+            self.assertEqual(response['Location'], '/recipes/1/')
+        with self.assertNumQueries(0):
+            self.client.get('/s/abc/')
+        self.assertEqual(self.client.get('/s/abd/').status_code,
+                         HTTPStatus.NOT_FOUND)
+
+
+@override_settings(CACHES=TEST_CACHES, IMAGE_WORKERS=0)
+class ShortLinkRaceTestCase(TempMediaMixin, TransactionTestCase):
+    """Одновременные первые запросы короткой ссылки."""
+
+    def test_parallel_get_link(self):
+        user = User.objects.create_user(
+            email='user@foodgram.ru', username='user', password='pass')
+        recipe = Recipe.objects.create(
+            author=user, name='Рецепт', text='текст',
+            image=image_file(), cooking_time=1)
+        barrier = threading.Barrier(THREADS)
+
+        def get_link(_):
+            try:
+                barrier.wait()
+                response = APIClient().get(
+                    f'/api/recipes/{recipe.id}/get-link/')
+                return response.status_code, response.json()['short-link']
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(THREADS) as executor:
+            results = set(executor.map(get_link, range(THREADS)))
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results.pop()[0], HTTPStatus.OK)
+        self.assertEqual(ShortLink.objects.count(), 1)
+
+
+@override_settings(CACHES=TEST_CACHES, IMAGE_WORKERS=0)
+class ImageVariantsTestCase(TempMediaMixin, TestCase):
+    """Уменьшенные копии фото рецептов."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_variants(self):
+        """Копии создаются после коммита и отдаются в карточках."""
+        user = User.objects.create_user(
+            email='user@foodgram.ru', username='user', password='pass')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=user, name='Рецепт', text='текст',
+                image=image_file((1600, 800)), cooking_time=1)
+        variants = self.client.get('/api/recipes/').json()[
+            'results'][0]['image_variants']
+        self.assertEqual((variants['width'], variants['height']),
+                         (1600, 800))
+        self.assertTrue(variants['placeholder'].startswith('data:image/'))
+        self.assertEqual(variants['card']['width'], 480)
+        self.assertEqual(variants['thumbnail']['height'], 80)
+        recipe.refresh_from_db()
+        for name in (recipe.image_variants['sizes']['card']['webp'],
+                     recipe.image_variants['sizes']['full']['jpg']):
+            self.assertTrue(default_storage.exists(name))
+
+    def test_replaced_image(self):
+        """Копии старого фото не отдаются после его замены."""
+        user = User.objects.create_user(
+            email='user@foodgram.ru', username='user', password='pass')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=user, name='Рецепт', text='текст',
+                image=image_file(), cooking_time=1)
+        recipe.image = image_file((2, 2))
+        recipe.save()
+        response = self.client.get(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.json()['image_variants'], {})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ImageUploadTestCase(TempMediaMixin, TestCase):
+    """Загрузка изображений файлом и строкой base64."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@foodgram.ru', username='user', password='pass')
+        cls.salt = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_recipe_multipart(self):
+        """Рецепт с фото в multipart/form-data."""
+        response = self.client.post('/api/recipes/', {
+            'ingredients[0]id': self.salt.id,
+            'ingredients[0]amount': 5,
+            'tags': [self.tag.id],
+            'image': image_file((20, 10)),
+            'name': 'Рецепт', 'text': 'текст', 'cooking_time': 1,
+        }, format='multipart')
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        recipe = Recipe.objects.get()
+        self.assertEqual((recipe.image.width, recipe.image.height), (20, 10))
+        self.assertEqual(recipe.ingredient_recipe.get().amount, 5)
+
+    def test_avatar_modes(self):
+        """Аватар сырыми байтами, в multipart и в base64."""
+        url = '/api/users/me/avatar/'
+        for kwargs in (
+                {'data': image_file().read(), 'content_type': 'image/png'},
+                {'data': {'avatar': image_file()}, 'format': 'multipart'},
+                {'data': {'avatar': IMAGE}, 'format': 'json'}):
+            with self.subTest(mode=kwargs.get('format', 'raw')):
+                User.objects.filter(id=self.user.id).update(avatar='')
+                response = self.client.put(url, **kwargs)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.user.refresh_from_db()
+                self.assertTrue(self.user.avatar)
+
+    def test_limits(self):
+        """Превышение размера и разрешения отклоняется при чтении."""
+        url = '/api/users/me/avatar/'
+        with patch('api.uploads.MAX_IMAGE_SIZE', 10):
+            response = self.client.put(url, data=image_file().read(),
+                                       content_type='image/png')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        for kwargs in (
+                {'data': image_file((20, 20)).read(),
+                 'content_type': 'image/png'},
+                {'data': {'avatar': image_file((20, 20))},
+                 'format': 'multipart'}):
+            with patch('api.uploads.MAX_IMAGE_PIXELS', 100):
+                response = self.client.put(url, **kwargs)
+            self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+            self.assertIn('Разрешение', str(response.json()))
+        with patch('api.uploads.MAX_IMAGE_SIZE', 10):
+            response = self.client.post('/api/recipes/', {
+                'image': image_file(), 'name': 'Рецепт'},
+                format='multipart')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_default_handlers(self):
+        """Прочие загрузки идут через обработчики Django по умолчанию."""
+        request = RequestFactory().post('/admin/', {'file': image_file()})
+        self.assertEqual(
+            [type(handler).__name__ for handler in request.upload_handlers],
+            ['MemoryFileUploadHandler', 'TemporaryFileUploadHandler'])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class MediaStorageTestCase(TestCase):
+    """Имена загрузок по содержимому и сборка ненужных файлов."""
+
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        media_settings = self.settings(MEDIA_ROOT=self.media)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.user = User.objects.create_user(
+            email='user@foodgram.ru', username='user', password='pass')
+
+    def make_old(self, *names):
+        hour_ago = time.time() - 60 * 60
+        for name in names:
+            os.utime(os.path.join(self.media, name), (hour_ago, hour_ago))
+
+    def test_deduplication(self):
+        """Одинаковые аватары двух пользователей - один файл."""
+        other = User.objects.create_user(
+            email='other@foodgram.ru', username='other', password='pass')
+        content = image_file().read()
+        client = APIClient()
+        for user in (self.user, other):
+            client.force_authenticate(user)
+            response = client.put('/api/users/me/avatar/', data=content,
+                                  content_type='image/png')
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.user.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.user.avatar.name, other.avatar.name)
+        self.assertEqual(self.user.avatar.name, 'avatars/{}.png'.format(
+            hashlib.sha256(content).hexdigest()))
+        self.assertEqual(len(os.listdir(
+            os.path.join(self.media, 'avatars'))), 1)
+
+    def test_collect_media(self):
+        """Удаляются только старые файлы без ссылок и их копии."""
+        recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт', text='текст',
+            image=image_file(), cooking_time=1)
+        stray = default_storage.save('recipes/stray.png', image_file())
+        fresh = default_storage.save('recipes/fresh.png', image_file())
+        avatar = default_storage.save('avatars/old.png', image_file())
+        stem = os.path.splitext(os.path.basename(recipe.image.name))[0]
+        for name in (stem, 'stray'):
+            default_storage.save(f'recipes/variants/{name}/card.jpg',
+                                 image_file())
+        self.make_old(recipe.image.name, stray, avatar,
+                      f'recipes/variants/{stem}', 'recipes/variants/stray')
+        call_command('collect_media', '--dry-run', '--min-age=0.5',
+                     stdout=StringIO())
+        self.assertTrue(default_storage.exists(stray))
+        call_command('collect_media', '--min-age=0.5', stdout=StringIO())
+        for name in (stray, avatar, 'recipes/variants/stray'):
+            self.assertFalse(default_storage.exists(name), name)
+        for name in (recipe.image.name, fresh, f'recipes/variants/{stem}'):
+            self.assertTrue(default_storage.exists(name), name)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class IngredientImportTestCase(TestCase):
+    """Импорт ингредиентов пачками из JSON и CSV."""
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.json_path = os.path.join(directory, 'ingredients.json')
+        self.csv_path = os.path.join(directory, 'ingredients.csv')
+        with open(self.json_path, 'w', encoding='utf-8') as file:
+            json.dump([{'name': f'ингредиент {number}',
+                        'measurement_unit': 'г'} for number in range(25)],
+                      file, ensure_ascii=False)
+        with open(self.csv_path, 'w', encoding='utf-8') as file:
+            file.write('ингредиент 0,кг\nсоль,г\n')
+
+    def import_ingredients(self, *paths):
+        out = StringIO()
+        call_command('import_json', *paths, '--batch-size=10', stdout=out)
+        return out.getvalue()
+
+    def test_import(self):
+        """Добавление, обновление единиц и повторный импорт."""
+        self.assertIn('добавлено 25, обновлено 0, пропущено 0',
+                      self.import_ingredients(self.json_path))
+        self.assertIn('добавлено 1, обновлено 1, пропущено 0',
+                      self.import_ingredients(self.csv_path))
+        self.assertEqual(Ingredient.objects.get(
+            name='ингредиент 0').measurement_unit, 'кг')
+        self.assertEqual(Ingredient.objects.count(), 26)
+        # Повторный импорт: по запросу на пачку, без записи.
+        with self.assertNumQueries(3):
+            self.assertIn('добавлено 0, обновлено 0, пропущено 2',
+                          self.import_ingredients(self.csv_path))
+
+    def test_parallel_insert(self):
+        """Ингредиент, вставленный параллельно, не считается добавленным."""
+        inserted = []
+
+        def parallel_insert(execute, sql, params, many, context):
+            if sql.lstrip().startswith('INSERT') and not inserted:
+                inserted.append(sql)
+                Ingredient.objects.create(name='соль', measurement_unit='г')
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(parallel_insert):
+            self.assertIn('добавлено 1, обновлено 0, пропущено 1',
+                          self.import_ingredients(self.csv_path))
+
+    def test_dictionary_version(self):
+        """Импорт меняет версию справочника ингредиентов."""
+        version = dictionaries.ingredients.get_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.import_ingredients(self.json_path)
+        self.assertNotEqual(dictionaries.ingredients.get_version(), version)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class GenerateDataTestCase(TempMediaMixin, TestCase):
+    """Синтетические данные для нагрузочного тестирования."""
+
+    def setUp(self):
+        cache.clear()
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(20))
+
+    def generate(self):
+        call_command('generate_data', '--users=10', '--recipes=30',
+                     '--favorites=40', '--carts=20', '--follows=15',
+                     '--batch-size=7', stdout=StringIO())
+
+    def test_generate(self):
+        """Объем данных, итоги корзин и одно фото на все рецепты."""
+        self.generate()
+        self.assertEqual(User.objects.count(), 10)
+        self.assertEqual(Recipe.objects.count(), 30)
+        self.assertEqual(Recipe.objects.values('image').distinct().count(), 1)
+        self.assertTrue(Favorite.objects.exists())
+        self.assertFalse(Follow.objects.filter(
+            user=F('author')).exists())
+        self.assertFalse(cart_totals.drift())
+        self.assertTrue(CartIngredient.objects.exists())
+        self.assertFalse(Recipe.objects.filter(ingredients=None).exists())
+
+
+# Запись поискового индекса: на SQLite - DELETE и INSERT в FTS5,
+# на PostgreSQL - один UPDATE; в бюджеты не входит.
+SEARCH_INDEX_SQL = re.compile(
+    rf'\s*(UPDATE recipes_recipe SET search_vector|'
+    rf'(DELETE FROM|INSERT INTO) {FTS_TABLE}\b)')
+# Бюджеты запросов маршрутов api.urls и shortlink.urls:
+# (имя маршрута, метод, путь, тело, (статус, запросов) для анонима
+# и для пользователя), без записи поискового индекса; None - не
+# проверяется (доступ проверяют отдельные тесты). Пути заполняются
+# данными QueryBudgetTestCase.
+QUERY_BUDGETS = (
+    ('api-root', 'get', '/api/', None, (200, 0), (200, 1)),
+    ('login', 'post', '/api/auth/token/login/',
+     {'email': 'user@foodgram.ru', 'password': 'pass'}, (200, 3), (200, 4)),
+    ('logout', 'post', '/api/auth/token/logout/', None, (401, 0), (204, 2)),
+    ('users-list', 'get', '/api/users/', None, (200, 2), (200, 4)),
+    ('users-list', 'post', '/api/users/',
+     {'email': 'new@foodgram.ru', 'username': 'new', 'first_name': 'Имя',
+      'last_name': 'Фамилия', 'password': 'Pass-word-123'},
+     (201, 4), (201, 5)),
+    ('users-detail', 'get', '/api/users/{author}/', None, (200, 1), (200, 3)),
+    ('users-detail', 'put', '/api/users/{user}/',
+     {'email': 'user@foodgram.ru', 'username': 'user',
+      'first_name': 'Имя', 'last_name': 'Фамилия'}, None, (200, 6)),
+    ('users-detail', 'patch', '/api/users/{user}/', {'first_name': 'Имя'},
+     None, (200, 5)),
+    ('users-detail', 'delete', '/api/users/{user}/',
+     {'current_password': 'pass'}, (401, 0), (204, 22)),
+    ('users-me', 'get', '/api/users/me/', None, (401, 0), (200, 2)),
+    ('users-me', 'put', '/api/users/me/',
+     {'email': 'user@foodgram.ru', 'username': 'user',
+      'first_name': 'Имя', 'last_name': 'Фамилия'}, (401, 0), (200, 5)),
+    ('users-me', 'patch', '/api/users/me/', {'first_name': 'Имя'},
+     (401, 0), (200, 4)),
+    ('users-me', 'delete', '/api/users/me/', {'current_password': 'pass'},
+     (401, 0), (204, 21)),
+    ('users-avatar', 'put', '/api/users/me/avatar/', {'avatar': IMAGE},
+     (401, 0), (200, 3)),
+    ('users-avatar', 'post', '/api/users/me/avatar/', {'avatar': IMAGE},
+     (401, 0), (200, 3)),
+    ('users-avatar', 'delete', '/api/users/me/avatar/', None,
+     (401, 0), (204, 3)),
+    ('users-set-password', 'post', '/api/users/set_password/',
+     {'current_password': 'pass', 'new_password': 'Pass-word-123'},
+     (401, 0), (204, 3)),
+    ('users-set-username', 'post', '/api/users/set_email/',
+     {'current_password': 'pass', 'new_email': 'renamed@foodgram.ru'},
+     (401, 0), (204, 4)),
+    ('users-activation', 'post', '/api/users/activation/', {},
+     (400, 0), (400, 1)),
+    ('users-resend-activation', 'post', '/api/users/resend_activation/',
+     {'email': 'nobody@foodgram.ru'}, (400, 1), (400, 2)),
+    ('users-reset-password', 'post', '/api/users/reset_password/',
+     {'email': 'nobody@foodgram.ru'}, (204, 1), (204, 2)),
+    ('users-reset-password-confirm', 'post',
+     '/api/users/reset_password_confirm/', {}, (400, 0), (400, 1)),
+    ('users-reset-username', 'post', '/api/users/reset_email/',
+     {'email': 'nobody@foodgram.ru'}, (204, 1), (204, 2)),
+    ('users-reset-username-confirm', 'post',
+     '/api/users/reset_email_confirm/', {}, (400, 0), (400, 1)),
+    ('users-subscriptions', 'get', '/api/users/subscriptions/', None,
+     (401, 0), (200, 4)),
+    ('users-subscribe', 'post', '/api/users/{other_author}/subscribe/', None,
+     (401, 0), (201, 8)),
+    ('users-subscribe', 'delete', '/api/users/{author}/subscribe/', None,
+     (401, 0), (204, 4)),
+    ('recipes-list', 'get', '/api/recipes/', None, (200, 4), (200, 6)),
+    ('recipes-list', 'post', '/api/recipes/', 'recipe', (401, 0), (201, 13)),
+    ('recipes-detail', 'get', '/api/recipes/{recipe}/', None,
+     (200, 3), (200, 5)),
+    ('recipes-detail', 'put', '/api/recipes/{own}/', 'recipe',
+     (401, 0), (200, 18)),
+    ('recipes-detail', 'patch', '/api/recipes/{own}/', 'recipe',
+     (401, 0), (200, 18)),
+    ('recipes-detail', 'delete', '/api/recipes/{own}/', None,
+     (401, 0), (204, 10)),
+    ('recipes-favorite', 'post', '/api/recipes/{other}/favorite/', None,
+     (401, 0), (201, 3)),
+    ('recipes-favorite', 'delete', '/api/recipes/{recipe}/favorite/', None,
+     (401, 0), (204, 2)),
+    ('recipes-shopping-cart', 'post', '/api/recipes/{other}/shopping_cart/',
+     None, (401, 0), (201, 6)),
+    ('recipes-shopping-cart', 'delete',
+     '/api/recipes/{recipe}/shopping_cart/', None, (401, 0), (204, 6)),
+    ('recipes-download-shopping-cart', 'get',
+     '/api/recipes/download_shopping_cart/', None, (401, 0), (200, 2)),
+    ('recipes-shopping-cart-summary', 'get',
+     '/api/recipes/shopping_cart_summary/', None, (401, 0), (200, 2)),
+    ('recipes-get-link', 'get', '/api/recipes/{recipe}/get-link/', None,
+     (200, 1), (200, 2)),
+    ('tags-list', 'get', '/api/tags/', None, (200, 1), (200, 2)),
+    ('tags-detail', 'get', '/api/tags/{tag}/', None, (200, 1), (200, 2)),
+    ('ingredients-list', 'get', '/api/ingredients/', None, (200, 1), (200, 2)),
+    ('ingredients-list', 'get', '/api/ingredients/?name=ингр', None,
+     (200, 1), (200, 2)),
+    ('ingredients-detail', 'get', '/api/ingredients/{ingredient}/', None,
+     (200, 1), (200, 2)),
+    ('s_link_redirect', 'get', '/s/{code}/', None, (301, 1), (301, 1)),
+)
+# Таблицы, которые могут читаться целиком: справочник тэгов мал.
+SMALL_TABLES = {'recipes_tag'}
+
+
+def url_routes(patterns):
+    """Имена и методы всех маршрутов модулей URL."""
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from url_routes(pattern.url_patterns)
+            continue
+        view = pattern.callback
+        if getattr(view, 'actions', None):
+            methods = [method for method in view.actions if method != 'head']
+        elif hasattr(view, 'cls'):
+            methods = [method for method in view.cls.http_method_names
+                       if method not in ('head', 'options')
+                       and hasattr(view.cls, method)]
+        else:
+            methods = ['get']
+        for method in methods:
+            yield pattern.name, method
+
+
+def full_scans(sql):
+    """
+    Таблицы, которые план запроса читает целиком. На PostgreSQL
+    последовательное чтение запрещено, и Seq Scan в плане остается,
+    только если подходящего индекса нет.
+    """
+    tables = set(connection.introspection.table_names())
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}')
+            scanned = {line.split(' on ')[1].split()[0]
+                       for line, in cursor.fetchall()
+                       if 'Seq Scan on ' in line}
+        else:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            scanned = {detail.split()[1] for *_, detail in cursor.fetchall()
+                       if detail.startswith('SCAN ')
+                       and 'USING' not in detail}
+    # Псевдонимы подзапросов Django (U0, U1...) - по таблицам.
+    aliases = dict((alias, table) for table, alias in re.findall(
+        r'"(\w+)" (U\d+)', sql))
+    return {aliases.get(name, name) for name in scanned} & tables
+
+
+@override_settings(CACHES=TEST_CACHES)
+class QueryBudgetTestCase(TempMediaMixin, TestCase):
+    """
+    Число запросов к БД каждого маршрута для анонима и пользователя
+    и планы горячих запросов без чтения больших таблиц целиком.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@foodgram.ru', username='user', password='pass')
+        cls.author = User.objects.create_user(
+            email='author@foodgram.ru', username='author', password='pass')
+        cls.other_author = User.objects.create_user(
+            email='other@foodgram.ru', username='other', password='pass')
+        cls.tags = [Tag.objects.create(name=f'Тэг {number}',
+                                       slug=f'tag{number}')
+                    for number in range(3)]
+        cls.ingredients = [Ingredient.objects.create(
+            name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(5)]
+        recipes = []
+        for number, author in enumerate(
+                (cls.author,) * 4 + (cls.other_author, cls.user)):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='текст',
+                image='recipes/recipe.png')
+            recipe.tags.set(cls.tags[:number % 3 + 1])
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                                 amount=number + 1)
+                for ingredient in cls.ingredients)
+            recipes.append(recipe)
+        cls.recipe, cls.other, cls.own = recipes[0], recipes[1], recipes[-1]
+        Favorite.objects.create(user=cls.user, recipe=cls.recipe)
+        Cart.objects.create(user=cls.user, recipe=cls.recipe)
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cart_totals.rebuild()
+        update_search_index()
+        cls.code = ShortLink.objects.for_recipe(cls.recipe.id)
+        cls.token = Token.objects.create(user=cls.user)
+
+    def recipe_data(self):
+        return {
+            'ingredients': [{'id': ingredient.id, 'amount': 3}
+                            for ingredient in self.ingredients[:3]],
+            'tags': [self.tags[0].id], 'image': IMAGE, 'name': 'Новый',
+            'text': 'текст', 'cooking_time': 5}
+
+    def measure(self, client, method, path, data):
+        """Статус и число запросов; изменения откатываются."""
+        cache.clear()
+        local_links.clear()
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(client, method)(path, data,
+                                                   format='json')
+            transaction.set_rollback(True)
+        return response.status_code, sum(
+            not SEARCH_INDEX_SQL.match(query['sql']) for query in queries)
+
+    def test_budgets(self):
+        """Статус и точное число запросов каждого маршрута."""
+        values = {'user': self.user.id, 'author': self.author.id,
+                  'other_author': self.other_author.id,
+                  'recipe': self.recipe.id, 'other': self.other.id,
+                  'own': self.own.id, 'tag': self.tags[0].id,
+                  'ingredient': self.ingredients[0].id, 'code': self.code}
+        anonymous = APIClient()
+        authenticated = APIClient()
+        authenticated.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        mismatches = []
+        for name, method, path, data, *budgets in QUERY_BUDGETS:
+            path = path.format(**values)
+            if data == 'recipe':
+                data = self.recipe_data()
+            for client, budget in zip((anonymous, authenticated), budgets):
+                if budget is None:
+                    continue
+                actual = self.measure(client, method, path, data)
+                if actual != budget:
+                    who = 'аноним' if client is anonymous else 'пользователь'
+                    mismatches.append(
+                        f'{method.upper()} {path} {who}: '
+                        f'ожидалось {budget}, получено {actual}')
+        self.assertFalse(mismatches, '\n'.join(mismatches))
+
+    def test_hot_query_plans(self):
+        """Горячие запросы не читают большие таблицы целиком."""
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for path in (
+                '/api/recipes/',
+                '/api/recipes/?tags=tag0&tags=tag1',
+                f'/api/recipes/?author={self.author.id}',
+                '/api/recipes/?is_favorited=1&is_in_shopping_cart=1',
+                '/api/recipes/download_shopping_cart/',
+                '/api/recipes/shopping_cart_summary/',
+                '/api/users/subscriptions/?recipes_limit=2'):
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(path)
+                b''.join(response)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            for query in queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                with self.subTest(path=path, sql=query['sql']), \
+                        transaction.atomic():
+                    self.assertFalse(
+                        full_scans(query['sql']) - SMALL_TABLES)
+
+    def test_every_route_has_budget(self):
+        """У каждого маршрута и метода есть бюджет."""
+        routes = set(url_routes(api_urls.urlpatterns)) | set(
+            url_routes(shortlink_urls.urlpatterns))
+        covered = {(name, method) for name, method, *_ in QUERY_BUDGETS}
+        self.assertFalse(routes - covered)
@@ -0,0 +1,120 @@
+"""
+Загрузка изображений файлом: multipart/form-data и сырые байты
+с Content-Type image/*; base64 в JSON остается для совместимости.
+
+Файл пишется во временный файл по мере чтения запроса, размер
+и разрешение проверяются на лету: разрешение - по заголовку картинки
+из первых прочитанных байт, до приема остального файла. Обработчик
+ставят только парсеры эндпоинтов с изображениями; остальные загрузки
+(в том числе админка) идут через обработчики Django по умолчанию.
+"""
+import io
+import mimetypes
+
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.utils.datastructures import MultiValueDict
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.fields import ImageField
+from rest_framework.parsers import FileUploadParser, MultiPartParser
+
+from api.constants import (MAX_IMAGE_HEADER_SIZE, MAX_IMAGE_PIXELS,
+                           MAX_IMAGE_SIZE)
+
+TOO_LARGE = f'Размер изображения больше {MAX_IMAGE_SIZE // 2 ** 20} МБ.'
+TOO_MANY_PIXELS = (f'Разрешение изображения больше '
+                   f'{MAX_IMAGE_PIXELS // 10 ** 6} Мп.')
+
+
+def check_pixels(width, height):
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ValidationError(TOO_MANY_PIXELS)
+
+
+class LimitedImageUploadHandler(TemporaryFileUploadHandler):
+    """Запись загрузки во временный файл с проверкой размера и разрешения."""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.header = bytearray()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > MAX_IMAGE_SIZE:
+            raise ParseError(TOO_LARGE)
+        if self.header is not None:
+            self.check_header(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def check_header(self, raw_data):
+        """
+        Разрешение по заголовку из начала файла: Image.open читает
+        только заголовок и не выделяет память под пиксели.
+        """
+        self.header += raw_data
+        try:
+            with Image.open(io.BytesIO(self.header)) as image:
+                size = image.size
+        except Image.DecompressionBombError:
+            raise ParseError(TOO_MANY_PIXELS)
+        except (OSError, SyntaxError):
+            if len(self.header) > MAX_IMAGE_HEADER_SIZE:
+                # Заголовок не разобран - файл проверит поле сериалайзера.
+                self.header = None
+            return
+        self.header = None
+        if size[0] * size[1] > MAX_IMAGE_PIXELS:
+            raise ParseError(TOO_MANY_PIXELS)
+
+
+class LimitedUploadMixin:
+    """Загрузки парсера проходят через LimitedImageUploadHandler."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']._request
+        request.upload_handlers = [LimitedImageUploadHandler(request)]
+        return super().parse(stream, media_type, parser_context)
+
+
+class ImageMultiPartParser(LimitedUploadMixin, MultiPartParser):
+    """multipart/form-data с изображением."""
+
+
+class ImageUploadParser(LimitedUploadMixin, FileUploadParser):
+    """Тело запроса - файл изображения; имя файла по Content-Type."""
+
+    media_type = 'image/*'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        result = super().parse(stream, media_type, parser_context)
+        # Как для форм: временный файл закроет и удалит Django
+        # по окончании запроса.
+        parser_context['request']._request._files = MultiValueDict(
+            {name: [file] for name, file in result.files.items()})
+        return result
+
+    def get_filename(self, stream, media_type, parser_context):
+        filename = super().get_filename(stream, media_type, parser_context)
+        if filename:
+            return filename
+        extension = mimetypes.guess_extension(media_type.split(';')[0])
+        return f'upload{extension or ""}'
+
+
+class UploadImageField(Base64ImageField):
+    """Изображение файлом из multipart или сырого тела либо строкой base64."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, UploadedFile):
+            if data.size > MAX_IMAGE_SIZE:
+                raise ValidationError(TOO_LARGE)
+            image = ImageField.to_internal_value(self, data)
+            check_pixels(*image.image.size)
+            return image
+        if isinstance(data, str) and len(data) * 3 // 4 > MAX_IMAGE_SIZE:
+            raise ValidationError(TOO_LARGE)
+        image = super().to_internal_value(data)
+        if image is not None:
+            check_pixels(*image.image.size)
+        return image
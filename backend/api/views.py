@@ -1,21 +1,44 @@
-from django.db.models import Sum
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, status, viewsets
+from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import FormParser, JSONParser
 from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAuthenticated
 from rest_framework.response import Response
-
+from rest_framework.settings import api_settings
+
+from api import dictionaries
+from api.cache import cache_anonymous, cache_stream, shopping_list_key
+from api.constants import (AUTOCOMPLETE_LIMIT, CURSOR_PAGINATION,
+                           PAGINATION_QUERY_PARAM,
+                           SHOPPING_LIST_DEFAULT_FORMAT,
+                           SHOPPING_LIST_FORMAT_PARAM)
 from api.filters import RecipeFilter
+from api.paginations import RecipeCursorPagination
 from api.permissions import IsOwnerOrReadOnly
-from api.serializers import (CartSerializer, FavoriteSerializer,
-                             IngredientSerializer, RecipeListSerializer,
+from api.serializers import (CartIngredientSerializer, CartSerializer,
+                             FavoriteSerializer, IngredientSerializer,
+                             RecipeFollowSerializer, RecipeListSerializer,
                              RecipeSerializer, TagSerializer)
-from recipes.models import Cart, Favorite, Ingredient, Recipe, Tag
-from recipes.shopping_list import shopping_list
+from api.uploads import ImageMultiPartParser
+from recipes import cart_totals
+from recipes.models import (Cart, CartIngredient, Favorite, Ingredient,
+                            IngredientRecipe, Recipe, Tag)
+from recipes.shopping_list import (FORMATS, cart_ingredients,
+                                   render_shopping_list, shopping_list)
 from shortlink.models import ShortLink
 from shortlink.serializers import ShortLinkSerializer
 
+# Ответ на повторное добавление в избранное/корзину: повтор отсекает
+# ограничение уникальности в CartFavoriteQuerySet.add.
+ALREADY_ADDED = 'рецепт уже добавлен.'
+
 
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
     """Вьюсет для тегов."""
@@ -25,6 +48,10 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = (AllowAny,)
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        """Список тэгов из снимка в памяти воркера."""
+        return dictionaries.tags.response(request)
+
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     """Вьюсет для ингридиентов."""
@@ -33,20 +60,63 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
-    filter_backends = (filters.SearchFilter,)
-    filterset_fields = ('name',)
-    search_fields = ('^name',)
+
+    def list(self, request, *args, **kwargs):
+        """
+        Список ингредиентов из снимка в памяти воркера,
+        при поиске - ранжированное автодополнение.
+        """
+        query = request.query_params.get(api_settings.SEARCH_PARAM)
+        if query:
+            index = dictionaries.ingredients.get_snapshot().index
+            return Response(index.search(query, AUTOCOMPLETE_LIMIT))
+        return dictionaries.ingredients.response(request)
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """Вьюсет для рецептов."""
 
-    queryset = Recipe.objects.select_related(
-        'author').prefetch_related('ingredients', 'tags')
+    lookup_value_regex = r'\d+'
+    queryset = Recipe.objects.select_related('author').prefetch_related(
+        Prefetch('ingredient_recipe',
+                 queryset=IngredientRecipe.objects.select_related(
+                     'ingredient')),
+        'tags')
     permission_classes = (IsOwnerOrReadOnly,)
+    parser_classes = (JSONParser, FormParser, ImageMultiPartParser)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    @property
+    def paginator(self):
+        """Курсорная пагинация при ?pagination=cursor."""
+        if (not hasattr(self, '_paginator')
+                and self.request.query_params.get(
+                    PAGINATION_QUERY_PARAM) == CURSOR_PAGINATION):
+            self._paginator = RecipeCursorPagination()
+        return super().paginator
+
+    def get_queryset(self):
+        """Рецепты с флагами избранного и корзины пользователя."""
+        return super().get_queryset().with_user_flags(self.request.user)
+
+    @cache_anonymous
+    def list(self, request, *args, **kwargs):
+        """Лента рецептов (для анонимов из кэша)."""
+        return super().list(request, *args, **kwargs)
+
+    @cache_anonymous
+    def retrieve(self, request, *args, **kwargs):
+        """Страница рецепта (для анонимов из кэша)."""
+        return super().retrieve(request, *args, **kwargs)
+
+    def get_serializer_context(self):
+        """Справочники для проверки id тэгов и ингредиентов рецепта."""
+        context = super().get_serializer_context()
+        context['dictionaries'] = {Ingredient: dictionaries.ingredients,
+                                   Tag: dictionaries.tags}
+        return context
+
     def get_serializer_class(self):
         """Выбор сериалайзера."""
         if self.action == 'favorite':
@@ -65,7 +135,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def favorite(self, request, pk):
         """Добавление/удаление рецепта в избранное."""
         if request.method == 'POST':
-            return self._cart_favorite_post(request, pk)
+            return self._cart_favorite_post(request, pk, Favorite)
         return self._cart_favorite_delete(request, pk, Favorite)
 
     @action(
@@ -73,11 +143,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
         detail=True,
         permission_classes=[IsAuthenticated]
     )
+    @transaction.atomic
     def shopping_cart(self, request, pk):
-        """Добавление/удаление рецепта в корзину."""
+        """
+        Добавление/удаление рецепта в корзину
+        (итоги корзины меняются в той же транзакции).
+        """
         if request.method == 'POST':
-            return self._cart_favorite_post(request, pk)
-        return self._cart_favorite_delete(request, pk, Cart)
+            return self._cart_favorite_post(
+                request, pk, Cart, cart_totals.add_to_cart)
+        return self._cart_favorite_delete(
+            request, pk, Cart, cart_totals.remove_from_cart)
 
     @action(
         methods=['GET'],
@@ -85,13 +161,36 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated]
     )
     def download_shopping_cart(self, request):
-        """Выгрузка ингридиентов из рецептов корзины."""
-        user = request.user
-        queryset = Cart.objects.filter(user=user).values_list(
-            'recipe__ingredients__name',
-            'recipe__ingredients__measurement_unit').annotate(
-            amount=Sum('recipe__ingredient_recipe__amount'))
-        return shopping_list(queryset)
+        """
+        Выгрузка ингридиентов из рецептов корзины в формате
+        из параметра file_format; файл неизмененной корзины из кэша.
+        """
+        file_format = request.query_params.get(
+            SHOPPING_LIST_FORMAT_PARAM, SHOPPING_LIST_DEFAULT_FORMAT)
+        if file_format not in FORMATS:
+            return Response(
+                {SHOPPING_LIST_FORMAT_PARAM: [
+                    f'Доступные форматы: {", ".join(FORMATS)}.']},
+                status=status.HTTP_400_BAD_REQUEST)
+        today = date.today()
+        chunks = cache_stream(
+            shopping_list_key(request.user, file_format, today),
+            render_shopping_list(
+                cart_ingredients(request.user), file_format, today))
+        return shopping_list(chunks, file_format, today)
+
+    @action(
+        methods=['GET'],
+        detail=False,
+        permission_classes=[IsAuthenticated]
+    )
+    def shopping_cart_summary(self, request):
+        """Суммы ингредиентов корзины из таблицы итогов."""
+        serializer = CartIngredientSerializer(
+            CartIngredient.objects.filter(
+                user=request.user).select_related('ingredient'),
+            many=True)
+        return Response(serializer.data)
 
     @action(
         methods=['GET'],
@@ -100,40 +199,44 @@ class RecipeViewSet(viewsets.ModelViewSet):
         url_path='get-link'
     )
     def get_link(self, request, pk):
-        """Создание/выдача короткой ссылки на рецепт."""
-        get_object_or_404(Recipe, id=pk)  # Ссылка только при наличии рецепта.
-        full_url = request.path[4:-9]
-        if ShortLink.objects.filter(full=full_url).exists():
-            link_object = ShortLink.objects.get(full=full_url)
-            serializer = ShortLinkSerializer(link_object)
-        else:
-            serializer = ShortLinkSerializer(
-                data={'full': full_url},
-                context={'request': request})
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-        s_link = serializer.data.get('short')
-        response_data = {'short-link': s_link}
+        """
+        Создание/выдача короткой ссылки на рецепт (только при наличии
+        рецепта) одним чтением или вставкой без гонок.
+        """
+        code = ShortLink.objects.for_recipe(int(pk))
+        if code is None:
+            raise Http404('Рецепт не найден.')
+        serializer = ShortLinkSerializer(
+            ShortLink(short=code), context={'request': request})
+        response_data = {'short-link': serializer.data.get('short')}
         return Response(response_data, status=status.HTTP_200_OK)
 
-    def _cart_favorite_post(self, request, pk):
-        """Добавление объекта в избранное/корзину."""
-        get_object_or_404(Recipe, id=pk)
-        user = request.user
-        serializer = self.get_serializer(
-            data={'recipe': pk},
-            context={'request': request})
-        serializer.is_valid(raise_exception=True)
-        serializer.save(user=user)
-        return Response(serializer.data,
-                        status=status.HTTP_201_CREATED)
-
-    def _cart_favorite_delete(self, request, pk, model):
-        """Удаление объекта из избранного/корзины."""
-        recipe = get_object_or_404(Recipe, id=pk)
-        user = request.user
-        model_recipe = model.objects.filter(recipe=recipe, user=user)
-        if model_recipe.exists():
-            model_recipe.delete()
+    def _cart_favorite_post(self, request, pk, model, changed=None):
+        """
+        Добавление рецепта в избранное/корзину: чтение карточки
+        и одна вставка, повтор отсекает ограничение уникальности.
+        changed(user_id, recipe_id) вызывается после вставки.
+        """
+        recipe = get_object_or_404(
+            Recipe.objects.only('id', 'name', 'cooking_time', 'image'),
+            id=pk)
+        if not model.objects.add(request.user.id, recipe.id):
+            raise ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [ALREADY_ADDED]})
+        if changed is not None:
+            changed(request.user.id, recipe.id)
+        serializer = RecipeFollowSerializer(
+            recipe, context=self.get_serializer_context())
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def _cart_favorite_delete(self, request, pk, model, changed=None):
+        """
+        Удаление рецепта из избранного/корзины одним DELETE;
+        рецепт ищется, только если удалять было нечего.
+        """
+        if model.objects.remove(request.user.id, pk):
+            if changed is not None:
+                changed(request.user.id, int(pk))
             return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(Recipe.objects.only('id'), id=pk)
         return Response(status=status.HTTP_400_BAD_REQUEST)
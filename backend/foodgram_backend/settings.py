@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -73,6 +74,23 @@ DATABASES = {
     }
 }
 
+# Версии кэша ответов и справочников должны быть видны всем процессам:
+# воркерам и командам manage.py. Файловый кэш общий для процессов
+# одного контейнера; для нескольких хостов - Redis
+# (CACHE_BACKEND=django.core.cache.backends.redis.RedisCache).
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram_cache')),
+    }
+}
+if CACHE_BACKEND.endswith('.FileBasedCache'):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': 10000}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -105,6 +123,16 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Потоков для копий фото рецептов (0 - копии делаются в запросе).
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+# Ключ перестановки кодов коротких ссылок.
+SHORT_LINK_SECRET = os.getenv('SHORT_LINK_SECRET', SECRET_KEY)
+
+# Шрифт с кириллицей для PDF списка покупок.
+SHOPPING_LIST_FONT = os.getenv(
+    'SHOPPING_LIST_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
@@ -1,8 +1,10 @@
 from django.contrib import admin
 
 from api.constants import ADMIN_EXTRA_FIELDS, ADMIN_FIELDS
+from recipes import cart_totals
 from recipes.models import (Cart, Favorite, Ingredient, IngredientRecipe,
                             Recipe, Tag)
+from recipes.search import update_search_index
 
 
 @admin.register(Tag)
@@ -42,6 +44,15 @@ class RecipeAdmin(admin.ModelAdmin):
     readonly_fields = ('get_favorite',)
     inlines = [RecipeInline]
 
+    def save_related(self, request, form, formsets, change):
+        """
+        Пересчет итогов корзин и поискового индекса
+        при сохранении состава.
+        """
+        with cart_totals.recipe_diffing(form.instance.id):
+            super().save_related(request, form, formsets, change)
+        update_search_index([form.instance.id])
+
     @admin.display(
         description='Добавлено в избранное раз'
     )
@@ -0,0 +1,198 @@
+"""
+Итоги корзин: суммы ингредиентов по рецептам корзины пользователя
+в таблице CartIngredient.
+
+Итоги меняются приращениями одним INSERT ... ON CONFLICT DO UPDATE
+(вычитание - это прибавление с обратным знаком), нулевые суммы удаляются.
+Итоги ведут сигналы, запись рецепта через API и админка. Массовые правки
+в обход них (bulk_create, bulk_update, QuerySet.update, сырой SQL,
+loaddata) итоги не меняют: после таких правок нужно запустить команду
+rebuild_cart_totals, она же исправляет расхождения.
+"""
+from contextlib import contextmanager
+
+from django.db import connection
+
+from recipes.models import CartIngredient
+
+UPSERT = '''
+    INSERT INTO recipes_cartingredient (user_id, ingredient_id, amount)
+    {select}
+    ON CONFLICT (user_id, ingredient_id) DO UPDATE
+    SET amount = recipes_cartingredient.amount + excluded.amount
+'''
+# Состав рецепта для одной корзины.
+USER_RECIPE = '''
+    SELECT %s, ingredient_id, %s * amount
+    FROM recipes_ingredientrecipe
+    WHERE recipe_id = %s
+'''
+# Состав рецепта для всех корзин, где он лежит.
+CARTS_RECIPE = '''
+    SELECT cart.user_id, ingredient_recipe.ingredient_id,
+        %s * ingredient_recipe.amount
+    FROM recipes_cart AS cart
+    JOIN recipes_ingredientrecipe AS ingredient_recipe
+        ON ingredient_recipe.recipe_id = cart.recipe_id
+    WHERE cart.recipe_id = %s
+'''
+# Приращения состава рецепта для всех корзин, где он лежит.
+CARTS_DELTA = '''
+    SELECT cart.user_id, delta.column1, delta.column2
+    FROM recipes_cart AS cart
+    CROSS JOIN (VALUES {values}) AS delta
+    WHERE cart.recipe_id = %s
+'''
+# Состав рецепта с суммой по повторам ингредиента.
+COMPOSITION = '''
+    SELECT ingredient_id, SUM(amount)
+    FROM recipes_ingredientrecipe
+    WHERE recipe_id = %s
+    GROUP BY ingredient_id
+'''
+DELETE_EMPTY = '''
+    DELETE FROM recipes_cartingredient
+    WHERE amount <= 0 AND ingredient_id IN (
+        SELECT ingredient_id FROM recipes_ingredientrecipe
+        WHERE recipe_id = %s)
+'''
+# Итоги, посчитанные заново по корзинам.
+AGGREGATE = '''
+    SELECT cart.user_id, ingredient_recipe.ingredient_id,
+        SUM(ingredient_recipe.amount)
+    FROM recipes_cart AS cart
+    JOIN recipes_ingredientrecipe AS ingredient_recipe
+        ON ingredient_recipe.recipe_id = cart.recipe_id
+    {where}
+    GROUP BY cart.user_id, ingredient_recipe.ingredient_id
+'''
+
+
+def apply_recipe(recipe_id, sign, user_id=None):
+    """
+    Прибавление (sign=1) или вычитание (sign=-1) состава рецепта
+    к итогам корзины пользователя или всех корзин с этим рецептом.
+    """
+    with connection.cursor() as cursor:
+        if user_id is None:
+            cursor.execute(UPSERT.format(select=CARTS_RECIPE),
+                           [sign, recipe_id])
+        else:
+            cursor.execute(UPSERT.format(select=USER_RECIPE),
+                           [user_id, sign, recipe_id])
+        if sign < 0:
+            statement, params = DELETE_EMPTY, [recipe_id]
+            if user_id is not None:
+                statement += ' AND user_id = %s'
+                params.append(user_id)
+            cursor.execute(statement, params)
+
+
+def add_to_cart(user_id, recipe_id):
+    """Рецепт добавлен в корзину."""
+    apply_recipe(recipe_id, 1, user_id)
+
+
+def remove_from_cart(user_id, recipe_id):
+    """Рецепт удаляется из корзины (вызывается до удаления)."""
+    apply_recipe(recipe_id, -1, user_id)
+
+
+def apply_delta(recipe_id, deltas):
+    """
+    Правка состава рецепта приращениями {ingredient_id: delta}:
+    меняются только итоги измененных ингредиентов во всех корзинах
+    с рецептом, вместо вычитания и прибавления состава целиком.
+    """
+    deltas = [(ingredient_id, delta)
+              for ingredient_id, delta in deltas.items() if delta]
+    if not deltas:
+        return
+    values = ', '.join(['(%s, %s)'] * len(deltas))
+    params = [value for row in deltas for value in row]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            UPSERT.format(select=CARTS_DELTA.format(values=values)),
+            params + [recipe_id])
+        removed = [ingredient_id for ingredient_id, delta in deltas
+                   if delta < 0]
+        if removed:
+            placeholders = ', '.join(['%s'] * len(removed))
+            cursor.execute(
+                'DELETE FROM recipes_cartingredient WHERE amount <= 0 '
+                f'AND ingredient_id IN ({placeholders}) AND user_id IN ('
+                'SELECT user_id FROM recipes_cart WHERE recipe_id = %s)',
+                removed + [recipe_id])
+
+
+def composition(recipe_id):
+    """Состав рецепта {ingredient_id: количество}."""
+    with connection.cursor() as cursor:
+        cursor.execute(COMPOSITION, [recipe_id])
+        return dict(cursor.fetchall())
+
+
+@contextmanager
+def recipe_diffing(recipe_id):
+    """
+    Правка состава рецепта произвольным кодом (например, инлайном
+    админки): состав читается до и после правки, итоги корзин
+    меняются на разницу через apply_delta.
+    """
+    before = composition(recipe_id)
+    yield
+    after = composition(recipe_id)
+    apply_delta(recipe_id, {
+        ingredient_id: after.get(ingredient_id, 0)
+        - before.get(ingredient_id, 0)
+        for ingredient_id in before.keys() | after.keys()})
+
+
+def _where(user_ids, column):
+    if user_ids is None:
+        return '', []
+    user_ids = list(user_ids)
+    placeholders = ', '.join(['%s'] * len(user_ids)) or 'NULL'
+    return f'WHERE {column} IN ({placeholders})', user_ids
+
+
+def aggregate(user_ids=None):
+    """Итоги по корзинам: {(user_id, ingredient_id): amount}."""
+    where, params = _where(user_ids, 'cart.user_id')
+    with connection.cursor() as cursor:
+        cursor.execute(AGGREGATE.format(where=where), params)
+        return {(user_id, ingredient_id): amount
+                for user_id, ingredient_id, amount in cursor.fetchall()}
+
+
+def stored(user_ids=None):
+    """Итоги из таблицы: {(user_id, ingredient_id): amount}."""
+    queryset = CartIngredient.objects.order_by()
+    if user_ids is not None:
+        queryset = queryset.filter(user_id__in=user_ids)
+    return {(user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in queryset.values_list(
+                'user_id', 'ingredient_id', 'amount').iterator()}
+
+
+def drift(user_ids=None):
+    """Пользователи, у которых итоги расходятся с корзиной."""
+    expected = aggregate(user_ids)
+    actual = stored(user_ids)
+    return {user_id for (user_id, _), _ in
+            set(expected.items()) ^ set(actual.items())}
+
+
+def rebuild(user_ids=None):
+    """Пересчет итогов с нуля; возвращает число записанных строк."""
+    delete_where, delete_params = _where(user_ids, 'user_id')
+    where, params = _where(user_ids, 'cart.user_id')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM recipes_cartingredient {delete_where}',
+            delete_params)
+        cursor.execute(
+            'INSERT INTO recipes_cartingredient '
+            '(user_id, ingredient_id, amount) '
+            + AGGREGATE.format(where=where), params)
+        return cursor.rowcount
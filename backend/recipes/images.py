@@ -0,0 +1,139 @@
+"""
+Уменьшенные копии фото рецептов.
+
+Копии в JPEG и WebP, размеры и крошечная заглушка для показа
+до загрузки рисуются в пуле потоков воркера после коммита записи
+рецепта; запрос сохраняет только оригинал.
+"""
+import base64
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from api.cache import invalidate_recipes
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+# Наибольшая сторона копий, px.
+VARIANTS = {
+    'thumbnail': 160,
+    'card': 480,
+    'full': 1200,
+}
+# Форматы копий: расширение -> (формат Pillow, параметры сохранения).
+FORMATS = {
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+}
+PLACEHOLDER_SIZE = 16
+VARIANTS_PATH = 'recipes/variants/{stem}/{label}.{extension}'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Пул потоков воркера, создается при первой задаче."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    settings.IMAGE_WORKERS,
+                    thread_name_prefix='recipe-images')
+    return _executor
+
+
+def encode(image, extension):
+    """Картинка в байтах заданного формата."""
+    image_format, options = FORMATS[extension]
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def save(path, content):
+    """Запись файла по точному пути (прежняя копия заменяется)."""
+    if default_storage.exists(path):
+        default_storage.delete(path)
+    return default_storage.save(path, ContentFile(content))
+
+
+def render_variants(name):
+    """Копии фото из хранилища; возвращает описание для image_variants."""
+    with default_storage.open(name) as original:
+        image = ImageOps.exif_transpose(Image.open(original))
+        image = image.convert('RGB')
+    width, height = image.size
+    stem = os.path.splitext(os.path.basename(name))[0]
+    sizes = {}
+    for label, side in VARIANTS.items():
+        variant = image.copy()
+        variant.thumbnail((side, side), Image.LANCZOS)
+        sizes[label] = {'width': variant.width, 'height': variant.height}
+        for extension in FORMATS:
+            sizes[label][extension] = save(
+                VARIANTS_PATH.format(stem=stem, label=label,
+                                     extension=extension),
+                encode(variant, extension))
+    placeholder = image.copy()
+    placeholder.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    return {
+        'source': name,
+        'width': width,
+        'height': height,
+        'placeholder': 'data:image/jpeg;base64,' + base64.b64encode(
+            encode(placeholder, 'jpg')).decode(),
+        'sizes': sizes,
+    }
+
+
+def generate_variants(recipe_id, name):
+    """
+    Копии фото рецепта; описание записывается, только если
+    за это время фото не заменили.
+    """
+    try:
+        variants = render_variants(name)
+        if Recipe.objects.filter(id=recipe_id, image=name).update(
+                image_variants=variants):
+            invalidate_recipes(recipe_id)
+    except Exception:
+        logger.exception('Не удалось сделать копии фото рецепта %s',
+                         recipe_id)
+
+
+def generate_in_pool(recipe_id, name):
+    """Задача пула: соединение с БД потока закрывается после нее."""
+    try:
+        generate_variants(recipe_id, name)
+    finally:
+        connection.close()
+
+
+def schedule_variants(recipe):
+    """Копии фото после коммита: в пуле потоков или сразу без пула."""
+    recipe_id, name = recipe.id, recipe.image.name
+
+    def submit():
+        if settings.IMAGE_WORKERS:
+            get_executor().submit(generate_in_pool, recipe_id, name)
+        else:
+            generate_variants(recipe_id, name)
+
+    transaction.on_commit(submit)
+
+
+def variants_outdated(recipe):
+    """Копии не сделаны или сделаны для прежнего фото."""
+    return bool(recipe.image) and (
+        recipe.image_variants.get('source') != recipe.image.name)
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+# Индекс для поиска ингредиентов по вхождению на PostgreSQL
+# (icontains в админке строит UPPER(name) LIKE ...); поиск по префиксу
+# идет по снимку справочника в памяти воркера.
+CREATE_INDEXES = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS ingredient_name_trgm_idx '
+    'ON recipes_ingredient USING gin (UPPER(name::text) gin_trgm_ops)',
+)
+DROP_INDEXES = (
+    'DROP INDEX IF EXISTS ingredient_name_trgm_idx',
+)
+
+
+def run_on_postgresql(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_postgresql(CREATE_INDEXES),
+                             run_on_postgresql(DROP_INDEXES)),
+    ]
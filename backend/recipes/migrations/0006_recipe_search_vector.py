@@ -0,0 +1,74 @@
+# Generated by Django 4.2.16 on 2026-10-18 05:51
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# GIN-индекс по документу на PostgreSQL и таблица FTS5 на SQLite.
+CREATE_INDEX = {
+    'postgresql': (
+        'CREATE INDEX recipe_search_vector_idx '
+        'ON recipes_recipe USING gin (search_vector)',
+    ),
+    'sqlite': (
+        'CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5('
+        'name, ingredients, text, '
+        "tokenize = 'unicode61 remove_diacritics 2')",
+    ),
+}
+# Документы существующих рецептов: дальше индекс обновляется при записи.
+# SQL записан здесь, а не взят из recipes.search, чтобы миграция
+# не менялась вместе с кодом приложения.
+INGREDIENT_NAMES = '''
+    SELECT {aggregate}
+    FROM recipes_ingredientrecipe AS ingredient_recipe
+    JOIN recipes_ingredient AS ingredient
+        ON ingredient.id = ingredient_recipe.ingredient_id
+    WHERE ingredient_recipe.recipe_id = recipes_recipe.id
+'''
+BACKFILL = {
+    'postgresql': (
+        "UPDATE recipes_recipe SET search_vector = "
+        "setweight(to_tsvector('russian', name), 'A') "
+        "|| setweight(to_tsvector('russian', coalesce(({}), '')), 'B') "
+        "|| setweight(to_tsvector('russian', text), 'C')".format(
+            INGREDIENT_NAMES.format(
+                aggregate="string_agg(ingredient.name, ' ')")),
+    ),
+    'sqlite': (
+        'INSERT INTO recipes_recipe_fts (rowid, name, ingredients, text) '
+        "SELECT id, name, coalesce(({}), ''), text "
+        'FROM recipes_recipe'.format(INGREDIENT_NAMES.format(
+            aggregate="group_concat(ingredient.name, ' ')")),
+    ),
+}
+DROP_INDEX = {
+    'postgresql': ('DROP INDEX IF EXISTS recipe_search_vector_idx',),
+    'sqlite': ('DROP TABLE IF EXISTS recipes_recipe_fts',),
+}
+
+
+def run_for_vendor(statements):
+    def operation(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for statement in statements.get(vendor, ()):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_ingredient_name_search_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый документ'),
+        ),
+        migrations.RunPython(run_for_vendor(CREATE_INDEX),
+                             run_for_vendor(DROP_INDEX)),
+        migrations.RunPython(run_for_vendor(BACKFILL),
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.16 on 2026-10-18 05:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum
+
+
+def fill_totals(apps, schema_editor):
+    """Итоги для уже собранных корзин."""
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    CartIngredient = apps.get_model('recipes', 'CartIngredient')
+    totals = IngredientRecipe.objects.filter(
+        recipe__carts__isnull=False
+    ).values_list('recipe__carts__user', 'ingredient').annotate(
+        total=Sum('amount')).order_by()
+    CartIngredient.objects.bulk_create(
+        (CartIngredient(user_id=user_id, ingredient_id=ingredient_id,
+                        amount=amount)
+         for user_id, ingredient_id, amount in totals.iterator()),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0006_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Итог корзины',
+                'verbose_name_plural': 'Итоги корзин',
+                'ordering': ('ingredient__name', 'ingredient__measurement_unit'),
+                'default_related_name': 'cart_ingredients',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='cartingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_cart_ingredient'),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
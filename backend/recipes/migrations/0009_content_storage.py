@@ -0,0 +1,19 @@
+# Generated by Django 4.2.16 on 2026-10-18 06:12
+
+import api.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(help_text='Загрузите фото блюда/рецепта', storage=api.storage.ContentAddressedStorage(), upload_to='recipes/', verbose_name='Фото блюда'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.16 on 2026-10-18 06:47
+
+from django.db import migrations, models
+from django.db.models import Min, Sum
+
+
+def remove_duplicates(apps, schema_editor):
+    """
+    Повторы рецепта в корзине и избранном (ограничения раньше не было)
+    удаляются; итоги корзин с повторами считаются заново.
+    """
+    for model_name in ('cart', 'favorite'):
+        model = apps.get_model('recipes', model_name)
+        duplicates = model.objects.exclude(id__in=model.objects.values(
+            'recipe', 'user').annotate(first=Min('id')).values('first'))
+        user_ids = set(duplicates.values_list('user_id', flat=True))
+        if not user_ids:
+            continue
+        duplicates.delete()
+        if model_name == 'cart':
+            refill_totals(apps, user_ids)
+
+
+def refill_totals(apps, user_ids):
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    CartIngredient = apps.get_model('recipes', 'CartIngredient')
+    CartIngredient.objects.filter(user_id__in=user_ids).delete()
+    totals = IngredientRecipe.objects.filter(
+        recipe__carts__user__in=user_ids
+    ).values_list('recipe__carts__user', 'ingredient').annotate(
+        total=Sum('amount')).order_by()
+    CartIngredient.objects.bulk_create(
+        (CartIngredient(user_id=user_id, ingredient_id=ingredient_id,
+                        amount=amount)
+         for user_id, ingredient_id, amount in totals.iterator()),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_content_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('recipe', 'user'), name='cart_unique_recipe_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('recipe', 'user'), name='favorite_unique_recipe_user'),
+        ),
+    ]
@@ -1,11 +1,14 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connection, models
+from django.db.models import Exists, OuterRef, Value
 from django.utils.text import Truncator
 
 from api.constants import (COOKING_TIME, INGREDIENT_AMOUNT,
                            MAX_ADMIN_NAME_LENGTH, NAME_LENGTH,
                            SHORT_NAME_LENGTH, TAG_LENGTH, UNIT_NAME_LENGTH)
+from api.storage import content_storage
 
 User = get_user_model()
 
@@ -76,6 +79,24 @@ class Tag(models.Model):
         return Truncator(self.name).chars(MAX_ADMIN_NAME_LENGTH)
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Кверисет рецептов."""
+
+    def with_user_flags(self, user):
+        """
+        Аннотация флагов is_favorited и is_in_shopping_cart
+        коррелированными подзапросами для пользователя.
+        """
+        if not user.is_authenticated:
+            return self.annotate(is_favorited=Value(False),
+                                 is_in_shopping_cart=Value(False))
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(Cart.objects.filter(
+                user=user, recipe=OuterRef('pk'))))
+
+
 class Recipe(models.Model):
     """Модель рецепта."""
 
@@ -89,6 +110,7 @@ class Recipe(models.Model):
     image = models.ImageField(
         verbose_name='Фото блюда',
         upload_to='recipes/',
+        storage=content_storage,
         help_text='Загрузите фото блюда/рецепта')
     text = models.TextField(
         verbose_name='Описание')
@@ -110,9 +132,20 @@ class Recipe(models.Model):
     pub_date = models.DateTimeField(
         verbose_name='Дата и время публикации',
         auto_now_add=True)
+    image_variants = models.JSONField(
+        verbose_name='Уменьшенные копии фото',
+        default=dict,
+        blank=True,
+        editable=False)
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый документ',
+        null=True,
+        editable=False)
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
         default_related_name = 'recipes'
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
@@ -121,6 +154,11 @@ class Recipe(models.Model):
                 fields=['author', 'name'],
                 name='unique_author_name'),
         )
+        indexes = (
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'),
+        )
 
     def __str__(self):
         return Truncator(self.name).chars(MAX_ADMIN_NAME_LENGTH)
@@ -154,6 +192,36 @@ class IngredientRecipe(models.Model):
         return f'{self.ingredient} {self.amount}'
 
 
+class CartFavoriteQuerySet(models.QuerySet):
+    """Запросы корзины и избранного."""
+
+    def add(self, user_id, recipe_id):
+        """
+        Добавление рецепта одной вставкой INSERT ... ON CONFLICT
+        DO NOTHING: False, если рецепт уже добавлен (или удален).
+        Сигналы модели не вызываются.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.model._meta.db_table} '
+                '(user_id, recipe_id) '
+                f'SELECT %s, id FROM {Recipe._meta.db_table} WHERE id = %s '
+                'ON CONFLICT DO NOTHING', [user_id, recipe_id])
+            return cursor.rowcount > 0
+
+    def remove(self, user_id, recipe_id):
+        """
+        Удаление рецепта одним DELETE: False, если его не было.
+        Сигналы модели не вызываются.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.model._meta.db_table} '
+                'WHERE user_id = %s AND recipe_id = %s',
+                [user_id, recipe_id])
+            return cursor.rowcount > 0
+
+
 class CartFavorite(models.Model):
     """Абстрактная модель для корзины и избранного."""
 
@@ -162,19 +230,20 @@ class CartFavorite(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE,
                              verbose_name='Пользователь')
 
+    objects = CartFavoriteQuerySet.as_manager()
+
     class Meta:
         abstract = True
-        ordering = ('recipe__name',)
         constraints = [
             models.UniqueConstraint(
                 fields=['recipe', 'user'],
-                name='unique_recipe_user')]
+                name='%(class)s_unique_recipe_user')]
 
 
 class Cart(CartFavorite):
     """Корзина покупок."""
 
-    class Meta:
+    class Meta(CartFavorite.Meta):
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзина'
         default_related_name = 'carts'
@@ -186,10 +255,38 @@ class Cart(CartFavorite):
 class Favorite(CartFavorite):
     """Избранное."""
 
-    class Meta:
+    class Meta(CartFavorite.Meta):
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
         default_related_name = 'favorites'
 
     def __str__(self):
         return f'{self.recipe.name} в избранном.'
+
+
+class CartIngredient(models.Model):
+    """
+    Сумма ингредиента по рецептам корзины пользователя.
+
+    Поддерживается приращениями при изменении корзины и состава
+    рецептов (recipes.cart_totals).
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             verbose_name='Пользователь')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE,
+                                   verbose_name='Ингредиент')
+    amount = models.IntegerField(verbose_name='Количество')
+
+    class Meta:
+        ordering = ('ingredient__name', 'ingredient__measurement_unit')
+        verbose_name = 'Итог корзины'
+        verbose_name_plural = 'Итоги корзин'
+        default_related_name = 'cart_ingredients'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_cart_ingredient')]
+
+    def __str__(self):
+        return f'{self.ingredient} {self.amount}'
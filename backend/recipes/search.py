@@ -0,0 +1,92 @@
+"""
+Полнотекстовый поиск рецептов по названию, описанию и ингредиентам.
+
+На PostgreSQL документ хранится в Recipe.search_vector (tsvector с русской
+морфологией под GIN-индексом), на SQLite - в таблице FTS5.
+Индекс обновляется явно после записи рецепта и его состава.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+WORDS = re.compile(r'\w+')
+
+# Названия ингредиентов рецепта одной строкой.
+POSTGRES_INGREDIENTS = '''
+    SELECT string_agg(ingredient.name, ' ')
+    FROM recipes_ingredientrecipe AS ingredient_recipe
+    JOIN recipes_ingredient AS ingredient
+        ON ingredient.id = ingredient_recipe.ingredient_id
+    WHERE ingredient_recipe.recipe_id = recipes_recipe.id
+'''
+POSTGRES_UPDATE = f'''
+    UPDATE recipes_recipe SET search_vector =
+        setweight(to_tsvector(%s, recipes_recipe.name), 'A')
+        || setweight(to_tsvector(%s, coalesce(({POSTGRES_INGREDIENTS}), '')),
+                     'B')
+        || setweight(to_tsvector(%s, recipes_recipe.text), 'C')
+'''
+SQLITE_INSERT = f'''
+    INSERT INTO {FTS_TABLE} (rowid, name, ingredients, text)
+    SELECT recipes_recipe.id, recipes_recipe.name, coalesce((
+        SELECT group_concat(ingredient.name, ' ')
+        FROM recipes_ingredientrecipe AS ingredient_recipe
+        JOIN recipes_ingredient AS ingredient
+            ON ingredient.id = ingredient_recipe.ingredient_id
+        WHERE ingredient_recipe.recipe_id = recipes_recipe.id), ''),
+        recipes_recipe.text
+    FROM recipes_recipe
+'''
+# Веса столбцов FTS5 для bm25: название, ингредиенты, описание.
+SQLITE_RANK = f'''
+    SELECT -bm25({FTS_TABLE}, 10.0, 4.0, 1.0) FROM {FTS_TABLE}
+    WHERE {FTS_TABLE} MATCH %s AND rowid = recipes_recipe.id
+'''
+
+
+def update_search_index(recipe_ids=None):
+    """Пересчет поискового документа рецептов (всех, если ids не заданы)."""
+    if recipe_ids is None:
+        params = []
+    else:
+        params = list(recipe_ids)
+        if not params:
+            return
+    placeholders = ', '.join(['%s'] * len(params))
+
+    def where(column):
+        return f'WHERE {column} IN ({placeholders})' if params else ''
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(POSTGRES_UPDATE + where('recipes_recipe.id'),
+                           [SEARCH_CONFIG] * 3 + params)
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f'DELETE FROM {FTS_TABLE} {where("rowid")}',
+                           params)
+            cursor.execute(SQLITE_INSERT + where('recipes_recipe.id'),
+                           params)
+
+
+def search_recipes(queryset, text):
+    """Рецепты, подходящие под запрос, по убыванию релевантности."""
+    ordering = queryset.query.order_by or queryset.model._meta.ordering
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(text, config=SEARCH_CONFIG,
+                            search_type='websearch')
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', *ordering)
+    words = WORDS.findall(text)
+    if not words:
+        return queryset.none()
+    # Без стемминга на SQLite слова ищутся по префиксу.
+    match = ' '.join(f'"{word}"*' for word in words)
+    return queryset.filter(id__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+    ).annotate(rank=RawSQL(SQLITE_RANK, [match])).order_by('-rank', *ordering)
@@ -1,17 +1,147 @@
+"""
+Список покупок: суммы ингредиентов корзины и выгрузка в файл.
+
+Файл отдается потоком по мере чтения строк из БД; формат выбирается
+из реестра FORMATS.
+"""
+import csv
+import io
 from datetime import date
 
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from PIL import Image, ImageDraw, ImageFont
+
+from recipes.models import CartIngredient
+
+# Строк, читаемых из серверного курсора за раз.
+CHUNK_SIZE = 500
+# Страница A4 при 150 dpi и ее разметка, px; черно-белая страница
+# сжимается в PDF на порядок лучше полутоновой.
+PDF_RESOLUTION = 150
+PDF_PAGE_SIZE = (1240, 1754)
+PDF_MARGIN = 110
+PDF_TITLE_SIZE = 44
+PDF_FONT_SIZE = 28
+PDF_LINE_SPACING = 1.6
+
+
+def cart_ingredients(user):
+    """Суммы ингредиентов корзины пользователя из таблицы итогов."""
+    return CartIngredient.objects.filter(user=user).values_list(
+        'ingredient__name', 'ingredient__measurement_unit', 'amount')
+
+
+def title(today):
+    """Заголовок списка покупок."""
+    return f'Список покупок на {today}:'
+
+
+def position_text(name, unit, amount):
+    """Строка позиции списка покупок."""
+    return f'{name} - {amount} {unit}.'
+
+
+def write_txt(rows, today):
+    """Текстовый файл: заголовок и позиции построчно."""
+    yield title(today).encode()
+    for name, unit, amount in rows:
+        yield f'\n{position_text(name, unit, amount)}'.encode()
+
+
+def write_csv(rows, today):
+    """CSV с BOM, чтобы кириллицу без настроек открывал Excel."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value.encode()
+
+    writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+    yield '\ufeff'.encode() + flush()
+    for name, unit, amount in rows:
+        writer.writerow((name, amount, unit))
+        yield flush()
+
+
+def load_font(size):
+    """Шрифт с кириллицей из настроек или встроенный шрифт Pillow."""
+    try:
+        return ImageFont.truetype(settings.SHOPPING_LIST_FONT, size)
+    except OSError:
+        return ImageFont.load_default(size)
+
+
+def wrap(text, font, width):
+    """Перенос строки по словам под ширину страницы."""
+    lines = []
+    line = ''
+    for word in text.split():
+        candidate = f'{line} {word}' if line else word
+        if line and font.getlength(candidate) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = candidate
+    return lines + [line]
+
+
+def write_pdf(rows, today):
+    """
+    PDF для печати: черно-белые страницы рисуются Pillow и собираются
+    в один документ, поэтому отдается целиком после последней строки.
+    """
+    width, height = PDF_PAGE_SIZE
+    text_width = width - 2 * PDF_MARGIN
+    title_font = load_font(PDF_TITLE_SIZE)
+    font = load_font(PDF_FONT_SIZE)
+    step = round(PDF_FONT_SIZE * PDF_LINE_SPACING)
+    pages = []
+
+    def new_page():
+        pages.append(Image.new('1', PDF_PAGE_SIZE, 1))
+        return ImageDraw.Draw(pages[-1]), PDF_MARGIN
+
+    draw, top = new_page()
+    draw.text((PDF_MARGIN, top), title(today), font=title_font, fill=0)
+    top += round(PDF_TITLE_SIZE * PDF_LINE_SPACING)
+    for name, unit, amount in rows:
+        lines = wrap(f'☐ {position_text(name, unit, amount)}',
+                     font, text_width)
+        if top + step * len(lines) > height - PDF_MARGIN:
+            draw, top = new_page()
+        for line in lines:
+            draw.text((PDF_MARGIN, top), line, font=font, fill=0)
+            top += step
+    document = io.BytesIO()
+    pages[0].save(document, 'PDF', resolution=PDF_RESOLUTION,
+                  save_all=True, append_images=pages[1:])
+    yield document.getvalue()
+
+
+# Форматы выгрузки: расширение -> (MIME-тип, генератор содержимого).
+FORMATS = {
+    'txt': ('text/plain; charset=utf-8', write_txt),
+    'csv': ('text/csv; charset=utf-8', write_csv),
+    'pdf': ('application/pdf', write_pdf),
+}
+
+
+def render_shopping_list(queryset, file_format, today=None):
+    """Части файла списка покупок, строки читаются серверным курсором."""
+    writer = FORMATS[file_format][1]
+    return writer(queryset.iterator(chunk_size=CHUNK_SIZE),
+                  today or date.today())
 
 
-def shopping_list(queryset) -> HttpResponse:
-    """Формирование файла списка покупок."""
-    today = date.today()
-    shop_list = f'Список покупок на {today}:'
-    for position in queryset:
-        row = f'\n{position[0]} - {position[2]} {position[1]}.'
-        shop_list += row
-    filename = f'shop_list_{today}.txt'
-    response = HttpResponse(
-        shop_list, content_type='text/plain')
+def shopping_list(chunks, file_format, today=None):
+    """Потоковый ответ с файлом списка покупок."""
+    today = today or date.today()
+    response = StreamingHttpResponse(
+        chunks, content_type=FORMATS[file_format][0])
+    filename = f'shop_list_{today}.{file_format}'
     response['Content-Disposition'] = f'attachment; filename={filename}'
     return response
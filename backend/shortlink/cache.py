@@ -0,0 +1,81 @@
+"""
+Разрешение кодов коротких ссылок: LRU в памяти воркера,
+затем общий кэш, затем один запрос по уникальному индексу.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.http import Http404
+
+from api.constants import (SHORT_LINK_CACHE_TIMEOUT, SHORT_LINK_LOCAL_SIZE,
+                           SHORT_LINK_LOCAL_TIMEOUT)
+from shortlink.models import ShortLink
+
+# Ключ полной ссылки в общем кэше.
+SHORT_LINK_KEY = 'shortlink:{code}'
+
+
+class LocalCache:
+    """Ограниченный по размеру и времени жизни LRU-кэш воркера."""
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.timeout)
+            self._data.move_to_end(key)
+            if len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_links = LocalCache(SHORT_LINK_LOCAL_SIZE, SHORT_LINK_LOCAL_TIMEOUT)
+
+
+def resolve(code):
+    """Полная ссылка по коду; Http404, если кода нет."""
+    full = local_links.get(code)
+    if full is not None:
+        return full
+    key = SHORT_LINK_KEY.format(code=code)
+    full = cache.get(key)
+    if full is None:
+        try:
+            full = ShortLink.objects.values_list(
+                'full', flat=True).get(short=code)
+        except ShortLink.DoesNotExist:
+            raise Http404('Короткая ссылка не найдена.')
+        cache.set(key, full, SHORT_LINK_CACHE_TIMEOUT)
+    local_links.set(code, full)
+    return full
+
+
+def forget(code):
+    """Сброс кэшей после изменения или удаления ссылки."""
+    local_links.delete(code)
+    cache.delete(SHORT_LINK_KEY.format(code=code))
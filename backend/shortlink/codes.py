@@ -0,0 +1,60 @@
+"""
+Коды коротких ссылок из id рецепта.
+
+Id переставляется ключевой сетью Фейстеля в пределах 62**length
+(значения за пределами диапазона проходят перестановку повторно),
+результат записывается в base62. Перестановка взаимно однозначна,
+поэтому коды разных рецептов одной длины не совпадают, а без ключа
+по коду нельзя угадать соседние. Длина растет, когда id не помещается
+в диапазон или код уже занят ссылкой, созданной прежним способом.
+"""
+import hmac
+from hashlib import sha256
+from string import ascii_letters, digits
+
+from django.conf import settings
+
+from api.constants import S_LINK_LENGTH
+
+ALPHABET = digits + ascii_letters
+BASE = len(ALPHABET)
+FEISTEL_ROUNDS = 4
+
+
+def encode(number, length):
+    """Запись числа в base62 ровно length символами."""
+    chars = []
+    for _ in range(length):
+        number, remainder = divmod(number, BASE)
+        chars.append(ALPHABET[remainder])
+    return ''.join(reversed(chars))
+
+
+def permute(number, length, key):
+    """Ключевая перестановка чисел диапазона [0, 62**length)."""
+    domain = BASE ** length
+    half = ((domain - 1).bit_length() + 1) // 2
+    mask = (1 << half) - 1
+    while True:
+        left, right = number >> half, number & mask
+        for step in range(FEISTEL_ROUNDS):
+            digest = hmac.new(key, f'{length}:{step}:{right}'.encode(),
+                              sha256).digest()
+            left, right = right, left ^ (
+                int.from_bytes(digest[:8], 'big') & mask)
+        number = (left << half) | right
+        if number < domain:
+            return number
+
+
+def short_code(recipe_id, is_taken):
+    """Код короткой ссылки рецепта; is_taken(code) - занят ли код."""
+    key = settings.SHORT_LINK_SECRET.encode()
+    length = S_LINK_LENGTH
+    while BASE ** length <= recipe_id:
+        length += 1
+    while True:
+        code = encode(permute(recipe_id, length, key), length)
+        if not is_taken(code):
+            return code
+        length += 1
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.16 on 2026-10-18 06:02
+
+from string import ascii_letters, digits
+
+from django.db import migrations, models
+
+ALPHABET = digits + ascii_letters
+
+
+def free_code(code, taken):
+    """Свободный код: к совпавшему дописываются символы base62."""
+    while True:
+        for char in ALPHABET:
+            if code + char not in taken:
+                return code + char
+        code += ALPHABET[0]
+
+
+def strip_urls(apps, schema_editor):
+    """
+    Полные адреса вида https://<хост>/s/<код>/ заменяются кодом.
+    Ссылки не удаляются: совпавший код со второго хоста остается
+    за первой ссылкой, а вторая получает свободный код на символ
+    длиннее и продолжает вести на свой рецепт.
+    """
+    ShortLink = apps.get_model('shortlink', 'ShortLink')
+    links = {link: link.short.rstrip('/').rsplit('/', 1)[-1]
+             for link in ShortLink.objects.order_by('id')}
+    taken = set(links.values())
+    codes = set()
+    # Уже записанные кодом ссылки идут первыми и сохраняют свой код.
+    for link in sorted(links, key=lambda link: links[link] != link.short):
+        code = links[link]
+        if code in codes:
+            code = free_code(code, taken)
+            taken.add(code)
+        codes.add(code)
+        if code != link.short:
+            link.short = code
+            link.save(update_fields=['short'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortlink', '0004_alter_shortlink_options'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shortlink',
+            name='short',
+            field=models.CharField(help_text='Код короткой ссылки /s/<код>/', max_length=150, unique=True, verbose_name='Код короткой ссылки'),
+        ),
+        migrations.RunPython(strip_urls, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,62 @@
-from django.db import models
+from django.db import connection, models
 from django.utils.text import Truncator
 
 from api.constants import MAX_ADMIN_NAME_LENGTH, USERNAME_LENGTH
+from recipes.models import Recipe
+from shortlink.codes import short_code
+
+# Ссылка создается, только если рецепт есть, и не создается повторно.
+INSERT_LINK = '''
+    INSERT INTO shortlink_shortlink ("full", short)
+    SELECT %s, %s
+    WHERE EXISTS (SELECT 1 FROM recipes_recipe WHERE id = %s)
+    ON CONFLICT DO NOTHING
+    RETURNING short
+'''
+
+
+def recipe_path(recipe_id):
+    """Путь страницы рецепта, на которую ведет ссылка."""
+    return f'/recipes/{recipe_id}/'
+
+
+class ShortLinkQuerySet(models.QuerySet):
+    """Запросы коротких ссылок."""
+
+    def _code(self, full):
+        return self.filter(full=full).values_list(
+            'short', flat=True).first()
+
+    def for_recipe(self, recipe_id):
+        """
+        Код ссылки на рецепт (None, если рецепта нет): чтение,
+        а при его промахе INSERT ... ON CONFLICT DO NOTHING, поэтому
+        одновременные запросы получают одну и ту же ссылку.
+        """
+        full = recipe_path(recipe_id)
+        code = self._code(full)
+        if code is not None:
+            return code
+        is_taken = (lambda code: False)
+        while True:
+            with connection.cursor() as cursor:
+                cursor.execute(INSERT_LINK, [
+                    full, short_code(recipe_id, is_taken), recipe_id])
+                row = cursor.fetchone()
+            if row is not None:
+                return row[0]
+            # Ссылку создал параллельный запрос, рецепта нет
+            # или код занят ссылкой, созданной прежним способом.
+            code = self._code(full)
+            if code is not None:
+                return code
+            if not Recipe.objects.filter(id=recipe_id).exists():
+                return None
+            is_taken = self.code_is_taken
+
+    def code_is_taken(self, code):
+        """Занят ли код короткой ссылки."""
+        return self.filter(short=code).exists()
 
 
 class ShortLink(models.Model):
@@ -11,10 +66,12 @@ class ShortLink(models.Model):
                             unique=True,
                             max_length=USERNAME_LENGTH,
                             help_text='Полная ссылка')
-    short = models.CharField(verbose_name='Короткая ссылка',
+    short = models.CharField(verbose_name='Код короткой ссылки',
                              unique=True,
                              max_length=USERNAME_LENGTH,
-                             help_text='Короткая ссылка')
+                             help_text='Код короткой ссылки /s/<код>/')
+
+    objects = ShortLinkQuerySet.as_manager()
 
     class Meta:
         ordering = ('full',)
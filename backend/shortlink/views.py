@@ -1,12 +1,9 @@
 from django.http import HttpResponse
 from django.shortcuts import redirect
 
-from shortlink.models import ShortLink
+from shortlink.cache import resolve
 
 
 def s_link_redirect(request, short_link) -> HttpResponse:
     """Переадресация по короткой ссылке."""
-    temp_short_url = request.build_absolute_uri()
-    if ShortLink.objects.filter(short=temp_short_url).exists():
-        full_url = ShortLink.objects.get(short=temp_short_url)
-        return redirect(f'{full_url}', permanent=True)
+    return redirect(resolve(short_link), permanent=True)
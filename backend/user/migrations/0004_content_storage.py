@@ -0,0 +1,19 @@
+# Generated by Django 4.2.16 on 2026-10-18 06:12
+
+import api.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0003_alter_user_username'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='avatar',
+            field=models.ImageField(blank=True, help_text='загрузите аватар', storage=api.storage.ContentAddressedStorage(), upload_to='avatars/', verbose_name='аватар'),
+        ),
+    ]
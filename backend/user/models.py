@@ -3,6 +3,7 @@ from django.db import models
 from django.utils.text import Truncator
 
 from api.constants import MAIL_LENGTH, MAX_ADMIN_NAME_LENGTH, USERNAME_LENGTH
+from api.storage import content_storage
 from user.validators import validate_username
 
 
@@ -34,6 +35,7 @@ class User(AbstractUser):
     avatar = models.ImageField(
         verbose_name='аватар',
         upload_to='avatars/',
+        storage=content_storage,
         help_text='загрузите аватар',
         blank=True
     )
@@ -1,14 +1,28 @@
 import re
 
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers, status
 from rest_framework.exceptions import ValidationError
 
 import api.serializers as api_serializers
-from api.constants import ACTION_ME, REGEX_VALIDATION, USERNAME_LENGTH
+from api.constants import (ACTION_ME, RECIPES_LIMIT_PARAM, REGEX_VALIDATION,
+                           USERNAME_LENGTH)
+from api.uploads import UploadImageField
 from user.models import Follow, User
 
 
+def get_subscribed_ids(request):
+    """
+    Id авторов, на которых подписан пользователь запроса.
+
+    Загружаются одним запросом и запоминаются на объекте запроса,
+    чтобы все вложенные UserSerializer отвечали из одного множества.
+    """
+    if not hasattr(request, 'subscribed_ids'):
+        request.subscribed_ids = set(Follow.objects.filter(
+            user=request.user).values_list('author_id', flat=True))
+    return request.subscribed_ids
+
+
 class UserSerializer(serializers.ModelSerializer):
     """Сериалайзер модели пользователя."""
 
@@ -27,9 +41,11 @@ class UserSerializer(serializers.ModelSerializer):
                   )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
-        return (request is not None and request.user.is_authenticated and obj.
-                authors.filter(user=request.user).exists())
+        return (request is not None and request.user.is_authenticated
+                and obj.id in get_subscribed_ids(request))
 
 
 class UserCreateSerializer(serializers.ModelSerializer):
@@ -68,7 +84,7 @@ class UserCreateSerializer(serializers.ModelSerializer):
 class AvatarSerializer(serializers.ModelSerializer):
     """Сериализатор аватара."""
 
-    avatar = Base64ImageField(allow_null=True)
+    avatar = UploadImageField(allow_null=True)
 
     class Meta:
         model = User
@@ -107,20 +123,32 @@ class SubscriptionsSerializer(UserSerializer):
     """Сериализатор вывода подписок."""
 
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.ReadOnlyField(source='recipes.count')
+    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = UserSerializer.Meta.model
         fields = UserSerializer.Meta.fields + ('recipes', 'recipes_count')
 
     def get_recipes(self, obj):
-        """Получение рецептов автора (с возможностью ограничения кол-ва)."""
-        request = self.context.get('request')
-        recipes = obj.recipes.all()
-        recipes_limit_str = request.query_params.get('recipes_limit', 'nope')
-        if recipes_limit_str.isdigit():
-            recipes_limit = int(recipes_limit_str)
-            recipes = recipes[:recipes_limit]
+        """
+        Получение рецептов автора (с возможностью ограничения кол-ва).
+        Из префетча они приходят уже обрезанными по recipes_limit.
+        """
+        if hasattr(obj, 'subscription_recipes'):
+            recipes = obj.subscription_recipes
+        else:
+            request = self.context.get('request')
+            recipes = obj.recipes.all()
+            recipes_limit_str = request.query_params.get(
+                RECIPES_LIMIT_PARAM, 'nope')
+            if recipes_limit_str.isdigit():
+                recipes_limit = int(recipes_limit_str)
+                recipes = recipes[:recipes_limit]
         return api_serializers.RecipeFollowSerializer(recipes,
                                                       context=self.context,
                                                       many=True).data
+
+    def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
+        return obj.recipes.count()
@@ -1,15 +1,22 @@
+from django.db.models import (Count, Exists, IntegerField, OuterRef, Prefetch,
+                              Subquery, Value)
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
 from djoser import views as djoser_views
 from djoser.conf import settings
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from api.constants import ACTION_ME
+from api.constants import ACTION_ME, RECIPES_LIMIT_PARAM, USER_UPDATE_ACTIONS
+from api.uploads import ImageMultiPartParser, ImageUploadParser
+from recipes.models import Recipe
 from user.models import Follow, User
-from user.serializers import AvatarSerializer, FollowSerializer, UserSerializer
+from user.serializers import (AvatarSerializer, FollowSerializer,
+                              SubscriptionsSerializer, UserSerializer)
 
 
 class UserViewSet(djoser_views.UserViewSet):
@@ -18,9 +25,35 @@ class UserViewSet(djoser_views.UserViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
 
+    def get_subscription_authors(self):
+        """
+        Авторы для карточек подписок с числом рецептов и флагом
+        подписки; первые recipes_limit рецептов каждого автора
+        выбираются одним запросом (ROW_NUMBER() OVER (PARTITION BY
+        author) у префетча со срезом), поэтому число запросов
+        не зависит от размера страницы.
+        """
+        user = self.request.user
+        recipes = Recipe.objects.only(
+            'id', 'name', 'cooking_time', 'image', 'author_id')
+        recipes_limit = self.request.query_params.get(RECIPES_LIMIT_PARAM, '')
+        if recipes_limit.isdigit():
+            recipes = recipes[:int(recipes_limit)]
+        return User.objects.annotate(
+            # Подзапрос вместо JOIN: count() пагинации его отбрасывает.
+            recipes_count=Coalesce(Subquery(
+                Recipe.objects.filter(author=OuterRef('pk')).order_by()
+                .values('author').annotate(count=Count('id'))
+                .values('count'), output_field=IntegerField()), 0),
+            is_subscribed=(Exists(Follow.objects.filter(
+                user=user, author=OuterRef('pk')))
+                if user.is_authenticated else Value(False)),
+        ).prefetch_related(Prefetch('recipes', queryset=recipes,
+                                    to_attr='subscription_recipes'))
+
     def get_permissions(self):
-        """Запрет входа на эндпоинт me анониму."""
-        if self.action == ACTION_ME:
+        """Запрет входа на эндпоинт me и изменения чужого профиля."""
+        if self.action == ACTION_ME or self.action in USER_UPDATE_ACTIONS:
             self.permission_classes = settings.PERMISSIONS.user_me
         return super().get_permissions()
 
@@ -28,12 +61,18 @@ class UserViewSet(djoser_views.UserViewSet):
         methods=['POST', 'PUT', 'DELETE'],
         detail=False,
         permission_classes=[IsAuthenticated],
+        parser_classes=[JSONParser, ImageMultiPartParser, ImageUploadParser],
         url_path='me/avatar'
     )
     def avatar(self, request):
-        """Добавление/удаление аватара."""
+        """
+        Добавление/удаление аватара: base64 в JSON, поле avatar
+        в multipart или файл телом запроса с Content-Type image/*.
+        """
         instance = self.get_instance()
         data = self.request.data
+        if 'file' in data:  # Файл телом запроса.
+            data = {'avatar': data['file']}
         if data and (request.method in ('POST', 'PUT')):
             serializer = AvatarSerializer(instance, data=data, partial=True)
             serializer.is_valid(raise_exception=True)
@@ -55,10 +94,11 @@ class UserViewSet(djoser_views.UserViewSet):
     )
     def subscriptions(self, request):
         """Подписки пользователя."""
-        follow_list = Follow.objects.filter(user=self.request.user)
-        follow_pages = self.paginate_queryset(follow_list)
-        serializer = FollowSerializer(
-            follow_pages,
+        authors = self.get_subscription_authors().filter(
+            id__in=Follow.objects.filter(user=request.user).values(
+                'author_id')).order_by('id')
+        serializer = SubscriptionsSerializer(
+            self.paginate_queryset(authors),
             many=True,
             context={'request': request})
         return self.get_paginated_response(serializer.data)
@@ -80,8 +120,10 @@ class UserViewSet(djoser_views.UserViewSet):
                 context={'request': request})
             serializer.is_valid(raise_exception=True)
             serializer.save()
-            return Response(serializer.data,
-                            status=status.HTTP_201_CREATED)
+            return Response(SubscriptionsSerializer(
+                self.get_subscription_authors().get(id=author.id),
+                context={'request': request}).data,
+                status=status.HTTP_201_CREATED)
 
         subscription = Follow.objects.filter(user=user, author=author)
         if subscription.exists():
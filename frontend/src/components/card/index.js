@@ -10,6 +10,7 @@ const Card = ({
   name = "Без названия",
   id,
   image,
+  image_variants = {},
   is_favorited,
   is_in_shopping_cart,
   tags,
@@ -46,7 +47,11 @@ const Card = ({
         title={
           <div
             className={styles.card__image}
-            style={{ backgroundImage: `url(${image})` }}
+            style={{
+              backgroundImage: image_variants.card
+                ? `url(${image_variants.card.webp}), url(${image_variants.placeholder})`
+                : `url(${image})`,
+            }}
           />
         }
       />